@@ -18,7 +18,12 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-target_metadata = None
+from models.ps_sql_schema import Base, DATABASE_URI
+
+target_metadata = Base.metadata
+
+# The app's DATABASE_URI (.env) wins over the url in alembic.ini
+config.set_main_option("sqlalchemy.url", DATABASE_URI.replace("%", "%%"))
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
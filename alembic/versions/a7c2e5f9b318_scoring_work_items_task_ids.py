@@ -0,0 +1,25 @@
+"""scoring_work_items.task_ids: the tasks an item may save scores for
+
+Revision ID: a7c2e5f9b318
+Revises: d3f6a8c1e7b5
+Create Date: 2026-10-18 18:41:52.907136
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c2e5f9b318'
+down_revision: Union[str, None] = 'd3f6a8c1e7b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # NULL for items queued before this revision; workers then allow any task of the item's person
+    op.execute("ALTER TABLE scoring_work_items ADD COLUMN IF NOT EXISTS task_ids TEXT")
+
+
+def downgrade():
+    op.drop_column('scoring_work_items', 'task_ids')
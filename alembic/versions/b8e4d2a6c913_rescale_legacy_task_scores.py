@@ -0,0 +1,34 @@
+"""rescale legacy task_scores to the 0-100 mean
+
+Revision ID: b8e4d2a6c913
+Revises: f2a9c7d4e610
+Create Date: 2026-10-18 16:02:44.517308
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e4d2a6c913'
+down_revision: Union[str, None] = 'f2a9c7d4e610'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Normally added by c41f7e2b9a05 already; init_db() no longer alters the table itself
+    op.execute("ALTER TABLE task_scores ADD COLUMN IF NOT EXISTS score_spread FLOAT")
+
+    # Rows written before self-consistency sampling hold the sum of 4 samples (0-400) and no
+    # spread; every newer row has a spread and a 0-100 mean
+    op.execute("UPDATE task_scores SET score = CAST(ROUND(score / 4.0) AS INTEGER) WHERE score_spread IS NULL")
+
+    op.execute("REFRESH MATERIALIZED VIEW kr_person_scores")
+    op.execute("REFRESH MATERIALIZED VIEW kr_person_day_scores")
+
+
+def downgrade():
+    op.execute("UPDATE task_scores SET score = score * 4 WHERE score_spread IS NULL")
+    op.execute("REFRESH MATERIALIZED VIEW kr_person_scores")
+    op.execute("REFRESH MATERIALIZED VIEW kr_person_day_scores")
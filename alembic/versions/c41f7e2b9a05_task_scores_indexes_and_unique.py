@@ -0,0 +1,52 @@
+"""task_scores table, lookup indexes and unique (task_id, kr_code)
+
+Revision ID: c41f7e2b9a05
+Revises: a1cc90a3e3e1
+Create Date: 2026-10-18 10:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f7e2b9a05'
+down_revision: Union[str, None] = 'a1cc90a3e3e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Databases set up by init_db() already have task_scores, maybe without score_spread.
+    # Plain IF NOT EXISTS DDL keeps this usable for offline (--sql) upgrades too.
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS task_scores ("
+        "id SERIAL PRIMARY KEY, "
+        "task_id INTEGER NOT NULL REFERENCES tasks (id), "
+        "kr_code VARCHAR(50) NOT NULL, "
+        "score INTEGER NOT NULL, "
+        "score_spread FLOAT, "
+        "person VARCHAR(50) NOT NULL)"
+    )
+    op.execute("ALTER TABLE task_scores ADD COLUMN IF NOT EXISTS score_spread FLOAT")
+
+    # Re-runs used to insert a second row per (task, KR); keep the most recent one
+    op.execute(
+        "DELETE FROM task_scores a USING task_scores b "
+        "WHERE a.task_id = b.task_id AND a.kr_code = b.kr_code AND a.id < b.id"
+    )
+
+    op.create_unique_constraint('uq_task_scores_task_id_kr_code', 'task_scores', ['task_id', 'kr_code'])
+    op.create_index('ix_task_scores_kr_code_person', 'task_scores', ['kr_code', 'person'])
+    op.create_index('ix_task_scores_task_id', 'task_scores', ['task_id'])
+    op.create_index('ix_tasks_person', 'tasks', ['person'])
+    op.create_index('ix_tasks_day', 'tasks', ['day'])
+
+
+def downgrade():
+    # task_scores itself is left in place: it predates this revision on most installs
+    op.drop_index('ix_tasks_day', table_name='tasks')
+    op.drop_index('ix_tasks_person', table_name='tasks')
+    op.drop_index('ix_task_scores_task_id', table_name='task_scores')
+    op.drop_index('ix_task_scores_kr_code_person', table_name='task_scores')
+    op.drop_constraint('uq_task_scores_task_id_kr_code', 'task_scores', type_='unique')
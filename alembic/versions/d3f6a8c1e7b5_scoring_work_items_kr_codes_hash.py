@@ -0,0 +1,38 @@
+"""scoring_work_items: unbounded kr_codes, unique key on its hash
+
+Revision ID: d3f6a8c1e7b5
+Revises: b8e4d2a6c913
+Create Date: 2026-10-18 17:24:09.381562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f6a8c1e7b5'
+down_revision: Union[str, None] = 'b8e4d2a6c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # A batched KR group can list more codes than VARCHAR(500) holds; the unique key moves to
+    # an md5 of the list (the same digest services/work_queue.py computes for new rows).
+    # Tables created by init_db() already have this shape, so every step is re-runnable.
+    op.execute("ALTER TABLE scoring_work_items ALTER COLUMN kr_codes TYPE TEXT")
+    op.execute("ALTER TABLE scoring_work_items ADD COLUMN IF NOT EXISTS kr_codes_hash VARCHAR(32)")
+    op.execute("UPDATE scoring_work_items SET kr_codes_hash = md5(kr_codes) WHERE kr_codes_hash IS NULL")
+    op.execute("ALTER TABLE scoring_work_items ALTER COLUMN kr_codes_hash SET NOT NULL")
+    op.execute("ALTER TABLE scoring_work_items DROP CONSTRAINT IF EXISTS uq_scoring_work_items_run_kr_person")
+    op.execute("ALTER TABLE scoring_work_items DROP CONSTRAINT IF EXISTS uq_scoring_work_items_run_kr_hash_person")
+    op.create_unique_constraint('uq_scoring_work_items_run_kr_hash_person', 'scoring_work_items',
+                                ['run_id', 'kr_codes_hash', 'person'])
+
+
+def downgrade():
+    op.drop_constraint('uq_scoring_work_items_run_kr_hash_person', 'scoring_work_items', type_='unique')
+    op.drop_column('scoring_work_items', 'kr_codes_hash')
+    op.execute("ALTER TABLE scoring_work_items ALTER COLUMN kr_codes TYPE VARCHAR(500)")
+    op.create_unique_constraint('uq_scoring_work_items_run_kr_person', 'scoring_work_items',
+                                ['run_id', 'kr_codes', 'person'])
@@ -0,0 +1,51 @@
+"""materialized score rollups per KR x person and KR x person x day
+
+Revision ID: e5b8d1c3f7a2
+Revises: c41f7e2b9a05
+Create Date: 2026-10-18 11:03:27.540918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b8d1c3f7a2'
+down_revision: Union[str, None] = 'c41f7e2b9a05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Score from which a task counts as contributing to a KR ("clear indirect contribution" and up)
+RELEVANT_SCORE = 70
+
+
+def upgrade():
+    op.execute(
+        "CREATE MATERIALIZED VIEW kr_person_scores AS "
+        "SELECT kr_code, person, "
+        "count(*) AS tasks_scored, "
+        f"count(*) FILTER (WHERE score >= {RELEVANT_SCORE}) AS relevant_tasks, "
+        "round(avg(score), 1)::float AS avg_score, "
+        "max(score) AS max_score "
+        "FROM task_scores GROUP BY kr_code, person"
+    )
+    op.execute(
+        "CREATE MATERIALIZED VIEW kr_person_day_scores AS "
+        "SELECT ts.kr_code, ts.person, t.day, "
+        "count(*) AS tasks_scored, "
+        f"count(*) FILTER (WHERE ts.score >= {RELEVANT_SCORE}) AS relevant_tasks, "
+        "sum(ts.score) AS score_sum, "
+        "max(ts.score) AS max_score "
+        "FROM task_scores ts JOIN tasks t ON t.id = ts.task_id "
+        "GROUP BY ts.kr_code, ts.person, t.day"
+    )
+    # Unique indexes allow REFRESH ... CONCURRENTLY and serve the per-KR / per-person lookups
+    op.execute("CREATE UNIQUE INDEX ux_kr_person_scores ON kr_person_scores (kr_code, person)")
+    op.execute("CREATE INDEX ix_kr_person_scores_person ON kr_person_scores (person)")
+    op.execute("CREATE UNIQUE INDEX ux_kr_person_day_scores ON kr_person_day_scores (kr_code, person, day)")
+    op.execute("CREATE INDEX ix_kr_person_day_scores_person_day ON kr_person_day_scores (person, day)")
+
+
+def downgrade():
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS kr_person_day_scores")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS kr_person_scores")
@@ -0,0 +1,48 @@
+"""scoring_work_items queue table
+
+Revision ID: f2a9c7d4e610
+Revises: e5b8d1c3f7a2
+Create Date: 2026-10-18 15:31:06.204417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a9c7d4e610'
+down_revision: Union[str, None] = 'e5b8d1c3f7a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # init_db() creates the table on first start of a new version, so IF NOT EXISTS as in c41f7e2b9a05
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS scoring_work_items ("
+        "id SERIAL PRIMARY KEY, "
+        "run_id VARCHAR(32) NOT NULL, "
+        "kr_codes VARCHAR(500) NOT NULL, "
+        "person VARCHAR(50) NOT NULL, "
+        "okrs TEXT NOT NULL, "
+        "task_text TEXT NOT NULL, "
+        "status VARCHAR(16) NOT NULL DEFAULT 'pending', "
+        "attempts INTEGER NOT NULL DEFAULT 0, "
+        "last_error TEXT, "
+        "lease_owner VARCHAR(100), "
+        "lease_expires_at TIMESTAMP WITHOUT TIME ZONE, "
+        "available_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "CONSTRAINT uq_scoring_work_items_run_kr_person UNIQUE (run_id, kr_codes, person))"
+    )
+    # Claim query: pending items that are due, or running items whose lease expired
+    op.execute("CREATE INDEX IF NOT EXISTS ix_scoring_work_items_status_available "
+               "ON scoring_work_items (status, available_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_scoring_work_items_run_status ON scoring_work_items (run_id, status)")
+
+
+def downgrade():
+    op.drop_index('ix_scoring_work_items_run_status', table_name='scoring_work_items')
+    op.drop_index('ix_scoring_work_items_status_available', table_name='scoring_work_items')
+    op.drop_table('scoring_work_items')
@@ -0,0 +1,110 @@
+"""
+Benchmark of the spreadsheet loaders in utils/excel_reader.py against the previous
+iterrows-based implementations, on a synthetic task spreadsheet.
+
+Every vectorized result is checked against the legacy output before timings are reported.
+
+Usage:
+    python -m benchmarks.excel_loaders --days 3000 --persons 40
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from models.schemas import TaskRow, OKR
+from utils.excel_reader import task_table_dicts, index_daily_task_table, load_daily_task_table, okrs_from_frame
+
+WORDS = ["پیگیری", "تیکت", "سرور", "جلسه", "تیم", "امنیت", "داشبورد", "گزارش", "Stored Procedure",
+         "ETL", "API", "داده", "Roaming", "تدوین", "OKR", "بررسی", "طراحی", "شاخص"]
+
+
+def synthetic_task_frame(days, persons, fill_rate, seed=42):
+    rng = random.Random(seed)
+    data = {"date": [14030101 + i for i in range(days)], "day": [f"day {i % 7}" for i in range(days)]}
+    for p in range(persons):
+        data[f"person{p:02d}"] = [
+            "\n".join(f"{n + 1}- " + " ".join(rng.choices(WORDS, k=6)) for n in range(rng.randint(1, 4)))
+            if rng.random() < fill_rate else None
+            for _ in range(days)
+        ]
+    return pd.DataFrame(data)
+
+
+def synthetic_okr_frame(count):
+    return pd.DataFrame({
+        "KR_code": [f"KR{i}" for i in range(count)],
+        "Key Results": [None if i % 10 == 0 else " ".join(WORDS[i % len(WORDS):]) for i in range(count)],
+    })
+
+
+def legacy_load_task_table(df):
+    task_cols = [c for c in df.columns if c not in ("date", "day")]
+    rows = []
+    for _, r in df.iterrows():
+        tasks = {}
+        for col in task_cols:
+            val = r[col]
+            if pd.notna(val):
+                tasks[col] = str(val).strip()
+        rows.append(TaskRow(tasks=tasks))
+    return rows
+
+
+def legacy_load_okrs(df):
+    df = df.copy()
+    df["Key Results"] = df["Key Results"].fillna("")
+    return [OKR(id=str(row["KR_code"]).strip(), description=str(row["Key Results"]).strip())
+            for _, row in df.iterrows()]
+
+
+def legacy_load_daily_task_table(df, day):
+    with pd.option_context("display.max_colwidth", None, "display.width", None):
+        return str([c for ind, c in df.iterrows() if c["date"] == day])
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=3000)
+    parser.add_argument("--persons", type=int, default=40)
+    parser.add_argument("--fill-rate", type=float, default=0.7)
+    parser.add_argument("--okrs", type=int, default=200)
+    parser.add_argument("--daily-sample", type=int, default=300,
+                        help="days rendered one by one for the per-day comparison (legacy is O(D) per day)")
+    args = parser.parse_args()
+
+    df = synthetic_task_frame(args.days, args.persons, args.fill_rate)
+    okr_df = synthetic_okr_frame(args.okrs)
+    print(f"synthetic spreadsheet: {args.days} days x {args.persons} persons, {args.okrs} OKRs")
+
+    legacy_rows, legacy_s = timed(legacy_load_task_table, df)
+    rows, new_s = timed(lambda frame: [TaskRow(tasks=tasks) for tasks in task_table_dicts(frame)], df)
+    assert rows == legacy_rows, "load_task_table output differs"
+    print(f"load_task_table        legacy {legacy_s:8.3f}s  vectorized {new_s:8.3f}s  x{legacy_s / new_s:6.1f}")
+
+    legacy_okrs, legacy_s = timed(legacy_load_okrs, okr_df)
+    okrs, new_s = timed(okrs_from_frame, okr_df)
+    assert okrs == legacy_okrs, "load_okrs output differs"
+    print(f"load_okrs              legacy {legacy_s:8.3f}s  vectorized {new_s:8.3f}s  x{legacy_s / new_s:6.1f}")
+
+    sample_days = list(df["date"])[:args.daily_sample]
+    legacy_texts, legacy_s = timed(lambda: [legacy_load_daily_task_table(df, day) for day in sample_days])
+    started = time.perf_counter()
+    index = index_daily_task_table(df)
+    texts = [load_daily_task_table(df, day, index) for day in sample_days]
+    new_s = time.perf_counter() - started
+    assert texts == legacy_texts, "load_daily_task_table output differs"
+    projected = legacy_s * args.days / len(sample_days)
+    print(f"load_daily_task_table  legacy {legacy_s:8.3f}s  indexed    {new_s:8.3f}s  "
+          f"({len(sample_days)} days; legacy projected {projected:.1f}s for all {args.days} days)")
+
+
+if __name__ == "__main__":
+    main()
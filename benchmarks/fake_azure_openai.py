@@ -0,0 +1,208 @@
+"""
+Local stand-in for the Azure OpenAI chat completions API, for offline load tests.
+
+Replies are canned but shaped like the real ones for every prompt this repo sends (scoring,
+compact and batched scoring, task/KR analysis, day ingest), with deterministic scores. Latency
+is `latency` seconds plus `completion tokens / token_rate`, and a share of requests
+(`rate_429`) is rejected with 429 and a Retry-After so the client retry path is exercised.
+Streaming (stream=True) is supported.
+
+Usage:
+    python -m benchmarks.fake_azure_openai --port 8910 --latency 0.4 --token-rate 80 --rate-429 0.05
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8910 AZURE_OPENAI_API_KEY=fake uvicorn main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from utils.tokens import count_tokens
+
+TASK_ID_PATTERNS = (re.compile(r"task_id=(\d+)"), re.compile(r"^(\d+)\|", re.MULTILINE))
+KR_LINE = re.compile(r"^- ([^:\n]+):", re.MULTILINE)
+KR_ID = re.compile(r'"id": "([^"]+)"')
+# "person00    1- task ..." lines of the pandas Series repr the ingest sends; empty cells are skipped
+PERSON_LINE = re.compile(r"^\[?(\S+) {2,}(?!(?:None|NaN)$)\S", re.MULTILINE)
+
+
+def fake_score(task_id, kr_code) -> int:
+    # Deterministic per (task, KR), skewed towards low relevance like real runs
+    digest = hashlib.sha1(f"{task_id}|{kr_code}".encode()).digest()
+    return int(digest[0] / 255 * 100 * (digest[1] / 255) ** 0.5)
+
+
+def canned_reply(messages, response_format=None) -> str:
+    """
+    JSON reply matching the prompt type of `messages`.
+    """
+    system = messages[0]["content"] if messages else ""
+    user = messages[-1]["content"] if messages else ""
+    task_ids = []
+    for pattern in TASK_ID_PATTERNS:
+        task_ids = [int(task_id) for task_id in pattern.findall(user)]
+        if task_ids:
+            break
+    kr_match = re.search(r"Target KR: (\S+)", user)
+    kr_code = kr_match.group(1) if kr_match else "KR"
+
+    if response_format and response_format.get("type") == "json_schema":
+        data = {"scores": [[task_id, fake_score(task_id, kr_code)] for task_id in task_ids]}
+        if "reasons" in response_format["json_schema"]["schema"]["properties"]:
+            data["reasons"] = [{"id": task_id, "reason": "synthetic"} for task_id in task_ids]
+        return json.dumps(data)
+    if "kr_scores" in system:
+        kr_codes = KR_LINE.findall(user.split("Target KRs:", 1)[-1])
+        return "```json\n" + json.dumps({"kr_scores": {
+            code: [{"id": task_id, "score": fake_score(task_id, code)} for task_id in task_ids]
+            for code in kr_codes
+        }}) + "\n```"
+    if "all_task_scores" in system:
+        return "```json\n" + json.dumps({
+            "kr_deconstruction": ["component 1", "component 2", "component 3"],
+            "task_analysis": {str(task_id): {"reason": "synthetic analysis of the task against the KR",
+                                             "relevance_score": fake_score(task_id, kr_code),
+                                             "confidence": 80, "include": True} for task_id in task_ids},
+            "all_task_scores": [{"id": task_id, "score": fake_score(task_id, kr_code),
+                                 "reason": "synthetic reason"} for task_id in task_ids],
+        }, ensure_ascii=False) + "\n```"
+    if "tasks_by_kr" in system:
+        kr_codes = KR_ID.findall(user) or [line.split("|", 1)[0] for line in user.splitlines() if "|" in line]
+        return "```json\n" + json.dumps({
+            "tasks_by_kr": {code: {"person00": ["synthetic task"]} for code in kr_codes},
+            "risks": {code: ["synthetic risk"] for code in kr_codes},
+            "deliverables": {code: ["synthetic deliverable"] for code in kr_codes},
+        }, ensure_ascii=False) + "\n```"
+    if "daily tasks for each person" in system:
+        persons = [p for p in PERSON_LINE.findall(user) if p not in ("date", "day", "Name:")]
+        return "```json\n" + json.dumps(
+            {person: [f"{person} synthetic task {n}" for n in range(3)] for person in dict.fromkeys(persons)},
+            ensure_ascii=False) + "\n```"
+    return "{}"
+
+
+class FakeStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = []
+
+    def snapshot(self) -> dict:
+        return {"calls": self.calls, "rate_limited": self.rate_limited, "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens, "latencies": list(self.latencies)}
+
+
+def create_app(latency=0.2, token_rate=0.0, rate_429=0.0, retry_after=0.05, seed=42) -> FastAPI:
+    """
+    `token_rate` is completion tokens per second (0 = instant generation).
+    """
+    app = FastAPI()
+    app.state.stats = FakeStats()
+    rng = random.Random(seed)
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        started = time.perf_counter()
+        stats = app.state.stats
+        body = await request.json()
+        if rng.random() < rate_429:
+            stats.rate_limited += 1
+            return JSONResponse({"error": {"code": "429", "message": "Rate limit is exceeded."}}, status_code=429,
+                                headers={"retry-after-ms": str(int(retry_after * 1000)),
+                                         "retry-after": str(max(1, round(retry_after)))})
+
+        messages = body.get("messages", [])
+        n = body.get("n") or 1
+        content = canned_reply(messages, body.get("response_format"))
+        prompt_tokens = sum(count_tokens(message.get("content") or "") for message in messages)
+        completion_tokens = count_tokens(content) * n
+        stats.calls += 1
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+        generation = completion_tokens / n / token_rate if token_rate else 0.0
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if body.get("stream"):
+            async def events():
+                await asyncio.sleep(latency)
+                pieces = [content[i:i + 40] for i in range(0, len(content), 40)] or [""]
+                for piece in pieces:
+                    await asyncio.sleep(generation / len(pieces))
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": deployment,
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage_chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                                   "model": deployment, "choices": [],
+                                   "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                             "total_tokens": prompt_tokens + completion_tokens}}
+                    yield f"data: {json.dumps(usage_chunk)}\n\n"
+                stats.latencies.append(time.perf_counter() - started)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency + generation)
+        stats.latencies.append(time.perf_counter() - started)
+        return {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": deployment,
+            "choices": [{"index": i, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+                        for i in range(n)],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @app.get("/_stats")
+    def get_stats():
+        return app.state.stats.snapshot()
+
+    return app
+
+
+@contextmanager
+def run_fake_server(port=8910, **config):
+    """
+    Serve the fake API on 127.0.0.1:`port` from a background thread; yields the FastAPI app
+    (its state.stats counts calls, 429s, tokens and per-call latencies).
+    """
+    app = create_app(**config)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.02)
+    try:
+        yield app
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8910)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="completion tokens per second, 0 = instant")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests rejected with 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After of injected 429s, seconds")
+    args = parser.parse_args()
+    app = create_app(args.latency, args.token_rate, args.rate_429, args.retry_after)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
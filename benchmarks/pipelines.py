@@ -0,0 +1,177 @@
+"""
+Offline end-to-end benchmark of the LLM pipelines against the fake Azure OpenAI server
+(benchmarks/fake_azure_openai.py), on synthetic workbooks in a scratch workspace with a
+SQLite tasks database. Nothing leaves the machine.
+
+Benchmarks, run in this order (the scoring run scores what the ingest inserted):
+    ingest      utils/input_task_seperator.ingest over every day of the task workbook
+    analyze     GET /analyze
+    analyze-kr  GET /analyze-kr/{kr_code}
+    three-step  the async 3-step scoring run (as /analyze_v2 and test.py run it)
+
+Each reports wall time, LLM calls, injected 429s, prompt/completion tokens and the p50/p95
+latency of the LLM calls (and of the HTTP requests for the endpoints).
+
+Usage:
+    python -m benchmarks.pipelines --days 30 --persons 10 --krs 12 --latency 0.3 --token-rate 100 --rate-429 0.05
+    OKR_SCORING_OUTPUT=compact python -m benchmarks.pipelines --only three-step --batch-krs
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS = ("ingest", "analyze", "analyze-kr", "three-step")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(workspace, port):
+    """
+    Point the app at the fake server and a scratch SQLite DB. Must run before any app module
+    is imported, since they read their configuration at import time.
+    """
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{port}",
+        "AZURE_OPENAI_API_KEY": "fake",
+        "DATABASE_URI": f"sqlite:///{os.path.join(workspace, 'tasks.sqlite3')}",
+        "OPENAI_CACHE_BACKEND": "",
+        "OPENAI_CACHE_BYPASS": "1",
+        "OKR_RESULT_CACHE_SIZE": "0",  # every repeat must reach the pipeline, not the result cache
+        "OKR_ROLLUP_REFRESH": "0",  # materialized views are Postgres only
+    })
+    os.makedirs(workspace, exist_ok=True)
+    os.chdir(workspace)  # the pipelines read assets/excel/... relative paths
+
+
+def run_benchmark(name, fake_app, run, verbose=False):
+    fake_app.state.stats.reset()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.perf_counter()
+    error = None
+    with output:
+        try:
+            request_latencies = run()
+        except Exception as e:
+            request_latencies, error = [], e
+    wall = time.perf_counter() - started
+    stats = fake_app.state.stats.snapshot()
+    return {"name": name, "wall": wall, "error": error, "requests": request_latencies, **stats}
+
+
+def timed_requests(client, path, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def print_report(results):
+    header = (f"{'benchmark':<12}{'wall s':>9}{'calls':>7}{'429s':>6}{'prompt tok':>12}{'compl tok':>11}"
+              f"{'llm p50':>9}{'llm p95':>9}{'req p50':>9}{'req p95':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        req = r["requests"]
+        req_cols = f"{percentile(req, 50):>9.3f}{percentile(req, 95):>9.3f}" if req else f"{'-':>9}{'-':>9}"
+        print(f"{r['name']:<12}{r['wall']:>9.2f}{r['calls']:>7}{r['rate_limited']:>6}{r['prompt_tokens']:>12}"
+              f"{r['completion_tokens']:>11}{percentile(r['latencies'], 50):>9.3f}"
+              f"{percentile(r['latencies'], 95):>9.3f}{req_cols}")
+    for r in results:
+        if r["error"] is not None:
+            print(f"{r['name']} failed: {r['error']!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--days", type=int, default=20)
+    parser.add_argument("--persons", type=int, default=8)
+    parser.add_argument("--krs", type=int, default=12)
+    parser.add_argument("--fill-rate", type=float, default=0.8)
+    parser.add_argument("--repeat", type=int, default=3, help="requests per endpoint benchmark")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake server seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="fake completion tokens per second")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests rejected with 429")
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=None, help="ingest workers (default OKR_INGEST_WORKERS)")
+    parser.add_argument("--concurrency", type=int, default=None, help="3-step concurrency (OKR_SCORING_CONCURRENCY)")
+    parser.add_argument("--batch-krs", action="store_true", help="3-step with multi-KR batched scoring")
+    parser.add_argument("--workspace", default=None, help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--verbose", action="store_true", help="show the pipelines' own output")
+    args = parser.parse_args()
+
+    workspace = os.path.abspath(args.workspace or tempfile.mkdtemp(prefix="okr_bench_"))
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, repo_root)
+    port = _free_port()
+    configure_environment(workspace, port)
+
+    # App modules are imported only now, with the benchmark configuration in place
+    from fastapi.testclient import TestClient
+    from benchmarks.fake_azure_openai import run_fake_server
+    from benchmarks.synthetic import write_workspace, synthetic_task_rows, TASK_XLSX
+    from core.analyzer import OKRAnalyzer
+    from main import app
+    from models.ps_sql_schema import get_task_db
+    from services.db_tasks import bulk_insert_tasks, get_existing_days
+    from utils.input_task_seperator import ingest, INGEST_WORKERS
+
+    write_workspace(workspace, args.days, args.persons, args.krs, args.fill_rate)
+    print(f"Workspace {workspace}: {args.days} days x {args.persons} persons, {args.krs} KRs")
+
+    def run_ingest():
+        ingest(TASK_XLSX, args.workers or INGEST_WORKERS)
+        return []
+
+    def run_three_step():
+        db_dic = get_task_db()
+        try:
+            if not get_existing_days(db_dic["session"], db_dic["Tasks"]):
+                bulk_insert_tasks(db_dic["session"], db_dic["Tasks"], synthetic_task_rows(args.days, args.persons))
+            asyncio.run(OKRAnalyzer.invoke_for_single_kr_with_description_for_split_tasks_3step_async(
+                db_dic, max_concurrency=args.concurrency, batch_krs=args.batch_krs))
+        finally:
+            db_dic["session"].close()
+        return []
+
+    results = []
+    with run_fake_server(port, latency=args.latency, token_rate=args.token_rate, rate_429=args.rate_429,
+                         retry_after=args.retry_after) as fake_app:
+        client = TestClient(app)
+        runs = {
+            "ingest": run_ingest,
+            "analyze": lambda: timed_requests(client, "/analyze", args.repeat),
+            "analyze-kr": lambda: timed_requests(client, "/analyze-kr/KR0", args.repeat),
+            "three-step": run_three_step,
+        }
+        for name in BENCHMARKS:
+            if name in args.only:
+                print(f"Running {name} ...")
+                results.append(run_benchmark(name, fake_app, runs[name], args.verbose))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Token counts and build times of the prompts in core/analyzer.py, verbose vs compact encoding
+(utils/prompt_encoding.py), on synthetic tasks. Scoring prompts are also measured with
+short task aliases from PromptCodec.
+
+The linear create_person_task_text is checked against the previous quadratic version first.
+
+Usage:
+    python -m benchmarks.prompt_encoding --days 60 --persons 12 --tasks 150 --krs 20
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from benchmarks.excel_loaders import WORDS, synthetic_task_frame
+from core.analyzer import (build_analysis_prompt, build_batched_prompt, build_single_kr_prompt,
+                           build_unified_prompt, create_person_task_text, render_person_tasks)
+from models.schemas import OKR, TaskRow
+from utils.excel_reader import task_table_dicts
+from utils.prompt_encoding import PromptCodec, encode_person_tasks
+from utils.tokens import count_messages_tokens
+
+
+def legacy_create_person_task_text(tasks_for_person, person):
+    text = f" for *{person}* we have these tasks: ["
+    for task in tasks_for_person:
+        text = text + f"## task_id={task.id}, task={task.task} ##,"
+    text = text + "]"
+    text.replace(",]", "]")
+    return text
+
+
+def synthetic_person_tasks(count, seed=42):
+    rng = random.Random(seed)
+    return [SimpleNamespace(id=250000 + i, task="\n".join(
+        f"{n + 1}- " + " ".join(rng.choices(WORDS, k=6)) for n in range(rng.randint(1, 3))))
+            for i in range(count)]
+
+
+def synthetic_okrs(count):
+    return [OKR(id=f"K-B2B-{i:03d}", description=" ".join(WORDS[i % len(WORDS):] + WORDS[:3]))
+            for i in range(count)]
+
+
+def timed(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--persons", type=int, default=12)
+    parser.add_argument("--tasks", type=int, default=150, help="tasks of the scored person")
+    parser.add_argument("--krs", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = [TaskRow(tasks=tasks) for tasks in task_table_dicts(synthetic_task_frame(args.days, args.persons, 0.7))]
+    tasks = synthetic_person_tasks(args.tasks)
+    okrs = synthetic_okrs(args.krs)
+    okr = okrs[0]
+
+    # Output of the linear join must match the old concatenation exactly
+    legacy_text, legacy_time = timed(lambda: legacy_create_person_task_text(tasks * 20, "rezazadeh"), args.repeat)
+    text, new_time = timed(lambda: create_person_task_text(tasks * 20, "rezazadeh"), args.repeat)
+    assert text == legacy_text
+    print(f"create_person_task_text ({len(tasks) * 20} tasks): "
+          f"{legacy_time * 1000:.2f} ms -> {new_time * 1000:.2f} ms")
+
+    def short_id_text():
+        return encode_person_tasks(tasks, "rezazadeh", PromptCodec())
+
+    prompts = {
+        "invoke": lambda fmt: build_analysis_prompt(rows, okrs, fmt),
+        "invoke_for_single_kr": lambda fmt: build_single_kr_prompt(rows, [okr], okr.id, prompt_format=fmt),
+        "invoke_for_single_kr_with_description": lambda fmt: build_single_kr_prompt(
+            rows, [okr], okr.id, "Objective -> GM KR -> BI KR", fmt),
+        "unified scoring": lambda fmt: build_unified_prompt(
+            short_id_text() if fmt == "short-ids" else render_person_tasks(tasks, "rezazadeh", fmt),
+            okr.id, okr.description),
+        "batched scoring": lambda fmt: build_batched_prompt(
+            short_id_text() if fmt == "short-ids" else render_person_tasks(tasks, "rezazadeh", fmt), okrs[:5]),
+    }
+
+    print(f"\n{'prompt':<40}{'format':<11}{'tokens':>8}{'saved':>8}{'build ms':>10}")
+    for name, build in prompts.items():
+        formats = ["verbose", "compact"] + (["short-ids"] if "scoring" in name else [])
+        baseline = None
+        for fmt in formats:
+            prompt, seconds = timed(lambda: build(fmt), args.repeat)
+            tokens = count_messages_tokens(prompt)
+            baseline = baseline or tokens
+            print(f"{name:<40}{fmt:<11}{tokens:>8}{(1 - tokens / baseline) * 100:>7.1f}%{seconds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Synthetic workbooks at configurable scale, laid out like assets/excel/ so the pipelines
+(which read hardcoded paths) can run unchanged from a scratch directory.
+
+    workspace/assets/excel/team tasks spreadsheet.xlsx   date, day, person00, person01, ...
+    workspace/assets/excel/okr.xlsx                       KR_code, Key Results
+    workspace/assets/excel/SPM BI OKR 1404.xlsx           objective -> GM KR -> BI KR sheet (utils/kr_index.py)
+"""
+import os
+import random
+
+import pandas as pd
+
+from benchmarks.excel_loaders import WORDS, synthetic_task_frame
+from utils.kr_index import OKR_SHEET, CODE_COL, OBJECTIVE_COL, GM_KR_COL, BI_KR_COL, DESCRIPTION_COL
+
+TASK_XLSX = "assets/excel/team tasks spreadsheet.xlsx"
+OKR_XLSX = "assets/excel/okr.xlsx"
+SPM_OKR_XLSX = "assets/excel/SPM BI OKR 1404.xlsx"
+
+
+def _phrase(rng, words=6):
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def synthetic_kr_frame(krs, krs_per_gm_kr=3, gm_krs_per_objective=2, seed=42):
+    """
+    SPM BI OKR sheet with `krs` BI KRs (codes KR0, KR1, ...), grouped under GM KRs and objectives.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(krs):
+        gm_kr = i // krs_per_gm_kr
+        objective = gm_kr // gm_krs_per_objective
+        rows.append({
+            CODE_COL: f"KR{i}",
+            OBJECTIVE_COL: f"Objective {objective}: {_phrase(random.Random(objective), 5)}",
+            GM_KR_COL: f"GM KR {gm_kr}: {_phrase(random.Random(gm_kr + 1000), 6)}",
+            BI_KR_COL: f"BI KR {i}: {_phrase(rng, 8)}",
+            DESCRIPTION_COL: _phrase(rng, 14) if i % 4 else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def synthetic_okr_frame(krs, seed=42):
+    """
+    okr.xlsx sheet (KR_code, Key Results) for the same KR codes as synthetic_kr_frame.
+    """
+    rng = random.Random(seed)
+    return pd.DataFrame({"KR_code": [f"KR{i}" for i in range(krs)],
+                         "Key Results": [f"BI KR {i}: {_phrase(rng, 8)}" for i in range(krs)]})
+
+
+def write_workspace(root, days=20, persons=8, krs=12, fill_rate=0.8, seed=42):
+    """
+    Write the three workbooks under `root`/assets/excel and return `root`.
+    """
+    os.makedirs(os.path.join(root, "assets", "excel"), exist_ok=True)
+    synthetic_task_frame(days, persons, fill_rate, seed).to_excel(os.path.join(root, TASK_XLSX), index=False)
+    synthetic_okr_frame(krs, seed).to_excel(os.path.join(root, OKR_XLSX), index=False)
+    synthetic_kr_frame(krs, seed=seed).to_excel(os.path.join(root, SPM_OKR_XLSX), sheet_name=OKR_SHEET, index=False)
+    return root
+
+
+def synthetic_task_rows(days=20, persons=8, tasks_per_day=3, seed=42):
+    """
+    Rows for bulk_insert_tasks ({"day", "person", "task"}), as the ingest would produce them.
+    """
+    rng = random.Random(seed)
+    return [
+        {"day": str(14030101 + day), "person": f"person{p:02d}", "task": _phrase(rng, 7)}
+        for day in range(days)
+        for p in range(persons)
+        for _ in range(rng.randint(1, tasks_per_day))
+    ]
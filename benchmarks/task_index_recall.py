@@ -0,0 +1,77 @@
+"""
+Recall benchmark for the lexical task prefilter (utils/task_index.py).
+
+For every (KR, person) pair that already has LLM scores in task_scores, the tasks scored at
+or above --relevant-score are treated as relevant. For each cutoff N the index shortlists the
+top N tasks of that person for the KR description, and the report shows how many relevant
+tasks survive (recall) and how much of the task text would still be sent (kept share).
+
+Usage:
+    python -m benchmarks.task_index_recall --cutoffs 10 20 50 100 --relevant-score 70
+"""
+import argparse
+import time
+from collections import defaultdict
+
+from models.ps_sql_schema import get_task_db
+from utils.excel_reader import load_okrs_with_objective
+from utils.task_index import TaskIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--okr-xlsx", default="assets/excel/SPM BI OKR 1404.xlsx")
+    parser.add_argument("--cutoffs", type=int, nargs="+", default=[10, 20, 50, 100, 200])
+    parser.add_argument("--relevant-score", type=int, default=70)
+    args = parser.parse_args()
+
+    db_dic = get_task_db()
+    session, Tasks, TaskScore = db_dic["session"], db_dic["Tasks"], db_dic["TaskScore"]
+
+    tasks = session.query(Tasks).all()
+    task_chars = {task.id: len(task.task) for task in tasks}
+    person_task_ids = defaultdict(list)
+    for task in tasks:
+        person_task_ids[task.person].append(task.id)
+
+    started = time.perf_counter()
+    index = TaskIndex()
+    index.add([t.id for t in tasks], [t.task for t in tasks], [t.person for t in tasks])
+    print(f"indexed {len(index)} tasks in {time.perf_counter() - started:.2f}s")
+
+    relevant = defaultdict(set)
+    for kr_code, person, task_id, score in session.query(
+            TaskScore.kr_code, TaskScore.person, TaskScore.task_id, TaskScore.score):
+        if score >= args.relevant_score:
+            relevant[(kr_code, person)].add(task_id)
+
+    okr_list, _ = load_okrs_with_objective(args.okr_xlsx, "")
+    descriptions = {okr.id: okr.description for okr in okr_list}
+    pairs = [pair for pair in relevant if pair[0] in descriptions]
+    if not pairs:
+        print("no scored (KR, person) pairs with relevant tasks found")
+        return
+
+    print(f"{len(pairs)} (KR, person) pairs, relevant = score >= {args.relevant_score}")
+    print(f"{'cutoff':>8} {'recall':>8} {'pairs@100%':>11} {'kept tasks':>11} {'kept chars':>11} {'ms/query':>9}")
+    for cutoff in args.cutoffs:
+        found = total = full_recall = 0
+        kept_tasks = all_tasks = kept_chars = all_chars = 0
+        started = time.perf_counter()
+        for kr_code, person in pairs:
+            shortlist = set(index.shortlist(descriptions[kr_code], cutoff, person=person))
+            hits = len(relevant[(kr_code, person)] & shortlist)
+            found += hits
+            total += len(relevant[(kr_code, person)])
+            full_recall += hits == len(relevant[(kr_code, person)])
+            kept_tasks += len(shortlist)
+            all_tasks += len(person_task_ids[person])
+            kept_chars += sum(task_chars[task_id] for task_id in shortlist)
+            all_chars += sum(task_chars[task_id] for task_id in person_task_ids[person])
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(pairs)
+        print(f"{cutoff:>8} {found / total:>8.1%} {full_recall / len(pairs):>11.1%} "
+              f"{kept_tasks / all_tasks:>11.1%} {kept_chars / all_chars:>11.1%} {elapsed_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,194 @@
 # services/okr_analyzer.py
+import asyncio
 import json
+import os
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
-from models.schemas import InputPayload, AnalysisResult
-from services.db_tasks import get_unique_persons, get_person_tasks, save_scores_in_db, is_task_kr_person_exist
+from models.schemas import InputPayload, AnalysisResult, ScoringRunSummary
+from services.db_tasks import get_unique_persons, get_person_tasks, save_scores_in_db, is_task_kr_person_exist, \
+    get_unscored_tasks
 from services.openai_client import client as openai_client
-from services.openai_client import OpenAIClient
-from utils.excel_reader import load_okrs, load_okrs_with_objective, run_analysis_cli_with_description
-from utils.extract_json_prompt import extract_json_from_response
+from services.metrics import metric_labels, propagate, timed
+from services.score_queries import refresh_score_rollups
+from services.work_queue import add_work_items, claim_work_item, complete_work_item, fail_work_item, heartbeat, \
+    is_run_finished, new_worker_id, release_work_item, retry_failed_items, run_pair_counts, \
+    run_status, LeaseHeartbeat, QUEUE_HEARTBEAT_SECONDS, QUEUE_POLL_SECONDS
+from services.openai_client import OpenAIClient, AsyncOpenAIClient, TruncatedResponseError
+from utils.excel_reader import load_okrs, load_okrs_with_objective, run_analysis_cli_with_description, SPM_OKR_XLSX
+from utils.extract_json_prompt import extract_json_from_response, StreamingJSONParser
+from utils.prompt_encoding import encode_okrs, encode_person_tasks, encode_task_table
+from utils.task_index import load_task_index
+from utils.tokens import count_tokens, count_messages_tokens
 from langchain_core.runnables import Runnable
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Max number of (KR, person) pairs scored at the same time by the async engine
+SCORING_CONCURRENCY = int(os.getenv("OKR_SCORING_CONCURRENCY", "8"))
+
+# Self-consistency sampling for get_initial_tasks
+SCORING_SAMPLES = int(os.getenv("OKR_SCORING_SAMPLES", "4"))  # max samples per (KR, person)
+SCORING_MIN_SAMPLES = int(os.getenv("OKR_SCORING_MIN_SAMPLES", "2"))  # first round, before checking convergence
+SCORING_TOLERANCE = float(os.getenv("OKR_SCORING_TOLERANCE", "5"))  # max score range per task to stop early
+SCORING_SAMPLE_MODE = os.getenv("OKR_SCORING_SAMPLE_MODE", "parallel")  # "parallel" requests or one request with "n"
+# With a single sample, the async engine streams the reply and saves scores every N entries as they arrive (0 = off)
+SCORING_STREAM_SAVE_EVERY = int(os.getenv("OKR_SCORING_STREAM_SAVE_EVERY", "25"))
+
+# Scoring reply: "full" (KR deconstruction, per-task analysis and reasons) or "compact" ([id, score] pairs
+# enforced with a strict JSON schema); OKR_SCORING_DEBUG_REASONING=1 adds a short reason per task to compact replies
+SCORING_OUTPUT = os.getenv("OKR_SCORING_OUTPUT", "full")
+SCORING_DEBUG_REASONING = os.getenv("OKR_SCORING_DEBUG_REASONING", "0") == "1"
+
+# Multi-KR batched scoring: one person's tasks against several KRs per request
+KR_BATCH_TOKEN_BUDGET = int(os.getenv("OKR_KR_BATCH_TOKEN_BUDGET", "16000"))  # prompt + expected completion
+KR_BATCH_COMPLETION_BUDGET = int(os.getenv("OKR_KR_BATCH_COMPLETION_BUDGET", "7000"))  # below chat max_tokens
+SCORE_ENTRY_TOKENS = 12  # approx. tokens of one {"id": 147, "score": 95} reply entry
+
+# Map-reduce analysis of large task tables (OKRAnalyzer.invoke*)
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("OKR_ANALYSIS_CHUNK_TOKENS", "6000"))  # task-table tokens per chunk
+ANALYSIS_CONCURRENCY = int(os.getenv("OKR_ANALYSIS_CONCURRENCY", "4"))  # chunks analysed at the same time
+
+# Prompt rendering of task tables, task lists and KRs: "verbose" (indented JSON, ## markers) or "compact"
+PROMPT_FORMAT = os.getenv("OKR_PROMPT_FORMAT", "verbose")
+
+# Lexical prefilter: tasks shortlisted per KR before LLM scoring (0 = send every task)
+PREFILTER_TOP_N = int(os.getenv("OKR_PREFILTER_TOP_N", "0"))
+
 
 def create_person_task_text(tasks_for_person, person):
-    text = f" for *{person}* we have these tasks: ["
-    for task in tasks_for_person:
-        text = text + f"## task_id={task.id}, task={task.task} ##,"
-    text = text + "]"
-    text.replace(",]", "]")
-    return text
+    # Verbose task list format; built with one join instead of repeated concatenation
+    tasks = "".join(f"## task_id={task.id}, task={task.task} ##," for task in tasks_for_person)
+    return f" for *{person}* we have these tasks: [{tasks}]"
 
 
-def get_initial_tasks(task_text, okr_id, okr_description):
-    # Build structured prompt focused on the single KR
-    initial_prompt = [
+def render_task_table(rows, prompt_format=None):
+    if (prompt_format or PROMPT_FORMAT) == "compact":
+        return encode_task_table(rows)
+    return json.dumps([row.tasks for row in rows], indent=2)
+
+
+def render_okrs(okrs, prompt_format=None):
+    if (prompt_format or PROMPT_FORMAT) == "compact":
+        return encode_okrs(okrs)
+    return json.dumps([okr.dict() for okr in okrs], indent=2)
+
+
+def render_person_tasks(tasks_for_person, person, prompt_format=None):
+    if (prompt_format or PROMPT_FORMAT) == "compact":
+        return encode_person_tasks(tasks_for_person, person)
+    return create_person_task_text(tasks_for_person, person)
+
+
+@timed("prompt_build")
+def build_analysis_prompt(rows, okrs, prompt_format=None):
+    # Build structured prompt with Chain-of-Thought
+    return [
         {"role": "system", "content": (
-            "You are a task filtering assistant. Your job is to identify tasks with *any* potential connection to the specified Key Result using their database IDs.\n"
+            "You are an analytics assistant tasked with mapping daily tasks to OKRs.\n"
             "CRITICAL INSTRUCTIONS:\n"
-            "1. Use ONLY task IDs in your response\n"
-            "2. Include tasks showing even indirect connection to the KR\n"
-            "3. Exclude tasks with no obvious relation\n"
-            "4. For each ID, provide explicit reasoning\n"
-            "5. Return tasks by ID in the exact JSON format\n\n"
+            "1. First, perform a detailed Chain-of-Thought analysis internally\n"
+            "2. Use the exact JSON schema provided below\n"
+            "3. Never include any text outside the JSON structure\n"
+            "4. Always use the same KR-to-task mapping logic\n\n"
 
-            "ANALYSIS FRAMEWORK:\n"
-            "For each task ID:\n"
-            "1. Does the task relate to any KR component?\n"
-            "2. Is there implicit/explicit connection to KR objectives?\n"
-            "3. Could it contribute to KR success (directly or indirectly)?\n\n"
+            "ANALYSIS STEPS:\n"
+            "1. For each task, identify its purpose and technical intent\n"
+            "2. Match tasks to KRs based on verbs and objectives\n"
+            "3. Group risks by common themes\n"
+            "4. Derive deliverables from task outcomes\n\n"
 
-            "RESPONSE FORMAT (STRICTLY FOLLOW):\n"
+            "EXAMPLE COMPLETION (partial):\n"
             "{\n"
-            "  \"kr_deconstruction\": [\"KR component 1\", \"KR component 2\", ...],\n"
-            "  \"task_analysis\": {\n"
-            "    \"147\": {\n"
-            "      \"reason\": \"Explicitly relates to infrastructure setup (KR component 1)\",\n"
-            "      \"relevance_score\": 90,\n"
-            "      \"include\": true\n"
-            "    },\n"
-            "    \"152\": {\n"
-            "      \"reason\": \"Meeting context unclear - could relate to KR planning\",\n"
-            "      \"relevance_score\": 60,\n"
-            "      \"include\": true\n"
+            "  \"tasks_by_kr\": {\n"
+            "    \"KR1\": {\n"
+            "      \"rezazadeh\": [\"1- پیگیری تیکت های...\", \"2- جلسه با تیم امنیت\"]\n"
             "    }\n"
             "  },\n"
-            "  \"candidate_task_ids\": [147, 152]\n"
+            "  \"risks\": {\n"
+            "    \"KR1\": [\"عدم دسترسی به سرورها\", \"تاخیر در راه اندازی سیستم جدید\"],\n"
+            "    \"KR2\": [\"عدم هماهنگی بین تیم‌ها\", \"مشکلات فنی در ETL\"],\n"
+            "    ...\n"
+            "  },\n"
+            "  \"deliverables\": {\n"
+            "    \"KR1\": [\"گزارش وضعیت سرورهای جدید\", \"روند کاری استاندارد امنیتی\"],\n"
+            "    ...\n"
+            "  }\n"
             "}\n\n"
 
-            "DATABASE TASK CONTEXT:\n"
-            "All tasks are stored with IDs in Persian format. Use only IDs in responses."
+
+
+            "ADDITIONAL RULES:\n"
+            "- Maintain consistent person names as given\n"
+            "- Use Persian tasks as-is without translation\n"
+            "- Preserve exact KR identifiers from input\n"
+            "- Prioritize precision over completeness\n"
+            "- Never invent new KRs or tasks"
         )},
         {"role": "user", "content": (
-            f"ID-to-Task Mapping:\n{task_text}\n\n"
-            f"Target KR: {okr_id}\n"
-            f"KR Description: {okr_description}\n\n"
-            "INSTRUCTION:\n"
-            "1. Deconstruct the KR into 3-5 components\n"
-            "2. Analyze each task ID with reasoning\n"
-            "3. Return candidate task IDs with:\n"
-            "   - Chain-of-thought analysis\n"
-            "   - Relevance score (0-100)\n"
-            "   - Inclusion decision\n"
-            "4. Final list must contain only IDs"
+            f"Task table (list of days): {render_task_table(rows, prompt_format)}\n"
+            f"OKRs list: {render_okrs(okrs, prompt_format)}"
         )}
     ]
 
-    unified_prompt = [
+
+@timed("prompt_build")
+def build_single_kr_prompt(rows, okrs, kr_code, okrs_text=None, prompt_format=None):
+    # Build structured prompt focused on the single KR; okrs_text adds the GM OKR relation
+    return [
+        {"role": "system", "content": (
+            f"You are an analytics assistant tasked with mapping daily tasks to a specific Key Result ({kr_code}).\n"
+            "CRITICAL INSTRUCTIONS:\n"
+            "1. Focus ONLY on tasks related to the provided KR\n"
+            "2. Use the exact JSON schema with the same keys\n"
+            "3. Never include any text outside the JSON structure\n"
+            "4. Prioritize precision over completeness\n"
+            "5. Only return data for the specified KR\n\n"
+
+            "ANALYSIS STEPS:\n"
+            "1. For each task, determine its relevance to the KR's objectives\n"
+            "2. Identify risks directly impacting KR achievement\n"
+            "3. Derive deliverables from completed/documented tasks\n\n"
+
+            "EXAMPLE COMPLETION (partial):\n"
+            "{\n"
+            f"  \"tasks_by_kr\": {{\n"
+            f"    \"{kr_code}\": {{\n"
+            "      \"rezazadeh\": [\"1- پیگیری تیکت های...\", \"2- جلسه با تیم امنیت\"],\n"
+            "      \"kakoolvand\": [\"1- پیگیری تیکت های...\", \"2- جلسه با تیم امنیت\"],\n"
+            "       ..."
+            "    }\n"
+            "  },\n"
+            f"  \"risks\": {{\n"
+            f"    \"{kr_code}\": [\"عدم دسترسی به سرورها\", \"تاخیر در راه اندازی سیستم جدید\"]\n"
+            "  },\n"
+            f"  \"deliverables\": {{\n"
+            f"    \"{kr_code}\": [\"گزارش وضعیت سرورهای جدید\", \"روند کاری استاندارد امنیتی\"]\n"
+            "  }\n"
+            "}\n\n"
+
+            "ADDITIONAL RULES:\n"
+            "- Maintain consistent person names as given\n"
+            "- Use Persian tasks as-is without translation\n"
+            "- Preserve exact KR identifiers from input\n"
+            "- Return empty arrays if no matches found\n"
+        )},
+        {"role": "user", "content": (
+            f"Task table (list of days): {render_task_table(rows, prompt_format)}\n"
+            f"Target KR: {render_okrs(okrs, prompt_format)}"
+            # the relation text follows the KR without a separator, as in the original prompt
+            f"{f'KR RELATION with GM OKR: {okrs_text}' if okrs_text is not None else ''}"
+        )}
+    ]
+
+
+@timed("prompt_build")
+def build_unified_prompt(task_text, okr_id, okr_description):
+    # Scoring prompt shared by the sync and async scoring paths
+    return [
         {"role": "system", "content": (
             "You are an advanced task-KR mapping specialist. For each task ID, perform a complete analysis from deconstruction to scoring.\n"
             "CRITICAL INSTRUCTIONS:\n"
@@ -141,101 +253,433 @@ def get_initial_tasks(task_text, okr_id, okr_description):
             "4. Final list must contain scores for every task ID"
         )}
     ]
-    tasks = {}
-    i = 0
-    while i < 4:
-        try:
-            content = OpenAIClient.chat(
-                unified_prompt,
-                temperature=0,  # Deterministic output
-                seed=42  # Reproducibility
+
+
+@timed("prompt_build")
+def build_compact_scoring_prompt(task_text, okr_id, okr_description, reasoning=False):
+    # Scores only: the reply is constrained by compact_scoring_format, so no format example is needed
+    return [
+        {"role": "system", "content": (
+            "You are a task-KR mapping specialist. Score how much each task ID contributes to the Key Result.\n"
+            "CRITICAL INSTRUCTIONS:\n"
+            "1. Return one [task_id, score] pair for EVERY input task (even those with zero relevance)\n"
+            "2. Score range: 0-100 (0 = completely unrelated, 100 = direct implementation)\n"
+            "3. Use ONLY the task IDs given\n\n"
+
+            "SCORING CRITERIA:\n"
+            "   - 90-100: Direct implementation of KR requirements\n"
+            "   - 70-89: Clear indirect contribution\n"
+            "   - 50-69: Potential tangential relevance\n"
+            "   - 0-49: No meaningful connection to KR"
+            + ("\n\nAlso give a one-sentence reason per task in \"reasons\"." if reasoning else "")
+        )},
+        {"role": "user", "content": (
+            f"ID-to-Task Mapping:\n{task_text}\n\n"
+            f"Target KR: {okr_id}\n"
+            f"KR Description: {okr_description}"
+        )}
+    ]
+
+
+def compact_scoring_format(reasoning=False):
+    """
+    Strict JSON schema for compact replies: {"scores": [[task_id, score], ...]}, plus
+    {"reasons": [{"id", "reason"}, ...]} when debugging.
+    """
+    properties = {"scores": {"type": "array", "items": {"type": "array", "items": {"type": "integer"}}}}
+    if reasoning:
+        properties["reasons"] = {"type": "array", "items": {
+            "type": "object",
+            "properties": {"id": {"type": "integer"}, "reason": {"type": "string"}},
+            "required": ["id", "reason"],
+            "additionalProperties": False,
+        }}
+    return {"type": "json_schema", "json_schema": {
+        "name": "task_scores",
+        "strict": True,
+        "schema": {"type": "object", "properties": properties, "required": list(properties),
+                   "additionalProperties": False},
+    }}
+
+
+def _parse_score_pairs(content):
+    data = extract_json_from_response(content, repair=True)
+    for entry in data.get("reasons", []):
+        logger.info(f"task {entry.get('id')}: {entry.get('reason')}")
+    entries = (_score_entry(pair[0], pair[1]) for pair in data["scores"] if isinstance(pair, list) and len(pair) >= 2)
+    return dict(entry for entry in entries if entry is not None)
+
+
+def _scoring_request(task_text, okr_id, okr_description, output=None, reasoning=None):
+    # (prompt, parse, chat params) of the selected scoring output mode
+    reasoning = SCORING_DEBUG_REASONING if reasoning is None else reasoning
+    if (output or SCORING_OUTPUT) == "compact":
+        return (build_compact_scoring_prompt(task_text, okr_id, okr_description, reasoning), _parse_score_pairs,
+                {"response_format": compact_scoring_format(reasoning)})
+    return build_unified_prompt(task_text, okr_id, okr_description), _parse_task_scores, {}
+
+
+def get_initial_tasks(task_text, okr_id, okr_description, samples=None, mode=None, tolerance=None, output=None):
+    """
+    Score every task against one KR with self-consistency sampling.
+
+    Samples run concurrently (mode="parallel") or as one request with `n` choices (mode="n").
+    After the first round, sampling stops early once every task's scores are within `tolerance`.
+    `output` is "full" or "compact" (default OKR_SCORING_OUTPUT, "full"); compact replies hold
+    only [id, score] pairs.
+    Returns {task_id: {"score": mean score 0-100, "spread": std dev across samples}}.
+    """
+    prompt, parse, chat_params = _scoring_request(task_text, okr_id, okr_description, output)
+    tasks = run_scoring_samples(prompt, parse, samples, mode, tolerance, chat_params)
+    logger.debug(f"{okr_id}: {tasks}")
+    return tasks
+
+
+async def get_initial_tasks_async(task_text, okr_id, okr_description, samples=None, mode=None, tolerance=None,
+                                  output=None):
+    # Same self-consistency scoring as get_initial_tasks, awaiting the LLM instead of blocking on it
+    prompt, parse, chat_params = _scoring_request(task_text, okr_id, okr_description, output)
+    return await run_scoring_samples_async(prompt, parse, samples, mode, tolerance, chat_params)
+
+
+def run_scoring_samples(prompt, parse, samples=None, mode=None, tolerance=None, chat_params=None):
+    """
+    Self-consistency driver: sample `prompt` until the parsed scores converge or `samples` is reached.
+    `parse` turns one completion into {key: score}; the aggregated {key: {"score", "spread"}} is returned.
+    `chat_params` are extra OpenAIClient.chat arguments such as response_format.
+    """
+    chat_params = chat_params or {}
+    samples = samples or SCORING_SAMPLES
+    mode = mode or SCORING_SAMPLE_MODE
+    tolerance = SCORING_TOLERANCE if tolerance is None else tolerance
+
+    sample_scores, errors = [], []
+    attempted = 0
+    while attempted < samples:
+        round_size = _next_round_size(attempted, samples)
+        if mode == "n":
+            try:
+                contents = OpenAIClient.chat_n(prompt, n=round_size, temperature=0, seed=42, sample=attempted,
+                                               **chat_params)
+            except Exception as e:
+                contents = [e] * round_size
+        else:
+            with ThreadPoolExecutor(max_workers=round_size) as pool:
+                contents = list(pool.map(propagate(lambda sample: _safe_chat(prompt, chat_params, sample)),
+                                         range(attempted, attempted + round_size)))
+        attempted += round_size
+        _collect_samples(contents, parse, sample_scores, errors)
+        if _has_converged(sample_scores, tolerance):
+            break
+
+    if not sample_scores:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {errors}")
+    logger.info(f"{len(sample_scores)}/{attempted} samples ok")
+    return aggregate_sample_scores(sample_scores)
+
+
+async def run_scoring_samples_async(prompt, parse, samples=None, mode=None, tolerance=None, chat_params=None):
+    # Async counterpart of run_scoring_samples
+    chat_params = chat_params or {}
+    samples = samples or SCORING_SAMPLES
+    mode = mode or SCORING_SAMPLE_MODE
+    tolerance = SCORING_TOLERANCE if tolerance is None else tolerance
+
+    sample_scores, errors = [], []
+    attempted = 0
+    while attempted < samples:
+        round_size = _next_round_size(attempted, samples)
+        if mode == "n":
+            try:
+                contents = await AsyncOpenAIClient.chat_n(prompt, n=round_size, temperature=0, seed=42,
+                                                          sample=attempted, **chat_params)
+            except Exception as e:
+                contents = [e] * round_size
+        else:
+            contents = await asyncio.gather(
+                *[AsyncOpenAIClient.chat(prompt, temperature=0, seed=42, sample=sample, **chat_params)
+                  for sample in range(attempted, attempted + round_size)],
+                return_exceptions=True
             )
+        attempted += round_size
+        _collect_samples(contents, parse, sample_scores, errors)
+        if _has_converged(sample_scores, tolerance):
+            break
+
+    if not sample_scores:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {errors}")
+    return aggregate_sample_scores(sample_scores)
+
+
+@timed("prompt_build")
+def build_batched_prompt(task_text, okrs):
+    # Scores one person's tasks against a group of KRs in a single structured reply
+    kr_lines = "\n".join(f"- {okr.id}: {okr.description}" for okr in okrs)
+    return [
+        {"role": "system", "content": (
+            "You are an advanced task-KR mapping specialist. Score every task ID against every listed Key Result.\n"
+            "CRITICAL INSTRUCTIONS:\n"
+            "1. Use ONLY task IDs and the exact KR codes given\n"
+            "2. Return scores for ALL tasks under EVERY KR (even those with zero relevance)\n"
+            "3. Score range: 0-100 (0 = completely unrelated, 100 = direct implementation)\n"
+            "4. Score each KR independently of the others\n"
+            "5. Never include text outside JSON structure\n\n"
+
+            "SCORING CRITERIA:\n"
+            "   - 90-100: Direct implementation of KR requirements\n"
+            "   - 70-89: Clear indirect contribution\n"
+            "   - 50-69: Potential tangential relevance\n"
+            "   - 0-49: No meaningful connection to KR\n\n"
+
+            "RESPONSE FORMAT:\n"
+            "{\n"
+            "  \"kr_scores\": {\n"
+            "    \"KR-CODE-1\": [{\"id\": 147, \"score\": 95}, {\"id\": 152, \"score\": 30}],\n"
+            "    \"KR-CODE-2\": [{\"id\": 147, \"score\": 10}, {\"id\": 152, \"score\": 75}]\n"
+            "  }\n"
+            "}\n\n"
+            "DATABASE TASK CONTEXT:\n"
+            "All tasks are stored with IDs in Persian format. Use only IDs in responses."
+        )},
+        {"role": "user", "content": (
+            f"ID-to-Task Mapping:\n{task_text}\n\n"
+            f"Target KRs:\n{kr_lines}\n\n"
+            "INSTRUCTION: Provide scores for every task ID under every target KR code."
+        )}
+    ]
+
+
+def plan_kr_batches(okrs, task_text, task_count, token_budget=None, completion_budget=None):
+    """
+    Group KRs so each batched request stays within the token budget.
+    The prompt grows with each KR line and the reply with one score entry per task per KR.
+    """
+    token_budget = token_budget or KR_BATCH_TOKEN_BUDGET
+    completion_budget = completion_budget or KR_BATCH_COMPLETION_BUDGET
+    base_tokens = count_messages_tokens(build_batched_prompt(task_text, []))
+    kr_completion = task_count * SCORE_ENTRY_TOKENS + 8
+
+    groups, current = [], []
+    prompt_tokens, completion_tokens = base_tokens, 0
+    for okr in okrs:
+        kr_prompt = count_tokens(f"- {okr.id}: {okr.description}")
+        over_budget = (prompt_tokens + kr_prompt + completion_tokens + kr_completion > token_budget
+                       or completion_tokens + kr_completion > completion_budget)
+        if current and over_budget:
+            groups.append(current)
+            current, prompt_tokens, completion_tokens = [], base_tokens, 0
+        current.append(okr)
+        prompt_tokens += kr_prompt
+        completion_tokens += kr_completion
+    if current:
+        groups.append(current)
+    return groups
 
-            # Extract JSON from response using triple backticks
-            data = extract_json_from_response(content)
-            for task in data["all_task_scores"]:
-                try:
-                    tasks[task["id"]] += task["score"]
-                except:
-                    tasks[task["id"]] = task["score"]
-            i += 1
 
+def get_batched_scores(task_text, okrs, samples=None, mode=None, tolerance=None):
+    """
+    Score a person's tasks against a group of KRs in one request per sample.
+    Returns {kr_code: {task_id: {"score": ..., "spread": ...}}}, one entry per requested KR,
+    ready to be passed to save_scores_in_db KR by KR.
+    """
+    prompt = build_batched_prompt(task_text, okrs)
+    parse = _batched_parser([okr.id for okr in okrs])
+    scores = run_scoring_samples(prompt, parse, samples, mode, tolerance)
+    return _split_batched_scores(scores, okrs)
 
+
+async def get_batched_scores_async(task_text, okrs, samples=None, mode=None, tolerance=None):
+    prompt = build_batched_prompt(task_text, okrs)
+    parse = _batched_parser([okr.id for okr in okrs])
+    scores = await run_scoring_samples_async(prompt, parse, samples, mode, tolerance)
+    return _split_batched_scores(scores, okrs)
+
+
+def _batched_parser(kr_codes):
+    # Flatten {"kr_scores": {kr: [...]}} to {(kr, task_id): score} so the sampling helpers apply unchanged
+    def parse(content):
+        data = extract_json_from_response(content, repair=True)
+        scores = {}
+        for kr_code, kr_tasks in data["kr_scores"].items():
+            if kr_code not in kr_codes:
+                continue
+            for task in kr_tasks:
+                entry = _score_entry(task.get("id"), task.get("score")) if isinstance(task, dict) else None
+                if entry is not None:
+                    scores[(kr_code, entry[0])] = entry[1]
+        return scores
+    return parse
+
+
+def _split_batched_scores(scores, okrs):
+    by_kr = {okr.id: {} for okr in okrs}
+    for (kr_code, task_id), scored in scores.items():
+        by_kr[kr_code][task_id] = scored
+    return by_kr
+
+
+def _next_round_size(attempted, samples):
+    # First round runs the minimum sample count, the second round whatever is left
+    if attempted == 0:
+        return max(1, min(SCORING_MIN_SAMPLES, samples))
+    return samples - attempted
+
+
+def _safe_chat(prompt, chat_params=None, sample=0):
+    try:
+        return OpenAIClient.chat(prompt, temperature=0, seed=42, sample=sample, **(chat_params or {}))
+    except Exception as e:
+        return e
+
+
+def _parse_task_scores(content):
+    # A reply cut off at max_tokens still yields the entries that arrived complete
+    data = extract_json_from_response(content, repair=True)
+    entries = (_score_entry(task.get("id"), task.get("score"))
+               for task in data["all_task_scores"] if isinstance(task, dict))
+    return dict(entry for entry in entries if entry is not None)
+
+
+def _score_entry(task_id, score):
+    # (int id, score) of a usable entry, else None: ids may come back as strings, scores must be numbers
+    if isinstance(task_id, bool) or isinstance(score, bool) or not isinstance(score, (int, float)):
+        return None
+    try:
+        return int(task_id), score
+    except (TypeError, ValueError):
+        return None
+
+
+def _collect_samples(contents, parse, sample_scores, errors):
+    # A failed or unparsable sample is dropped instead of aborting the whole pair
+    for content in contents:
+        if isinstance(content, BaseException):
+            errors.append(str(content))
+            continue
+        try:
+            sample_scores.append(parse(content))
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
-    print(str(tasks))
+            errors.append(str(e))
+
+
+def _has_converged(sample_scores, tolerance):
+    if len(sample_scores) < SCORING_MIN_SAMPLES:
+        return False
+    task_ids = set().union(*sample_scores)
+    for task_id in task_ids:
+        scores = [sample[task_id] for sample in sample_scores if task_id in sample]
+        if len(scores) < len(sample_scores) or max(scores) - min(scores) > tolerance:
+            return False
+    return True
+
+
+def aggregate_sample_scores(sample_scores):
+    """
+    Collapse per-sample scores into {task_id: {"score": mean (0-100), "spread": std dev}}.
+    """
+    tasks = {}
+    for task_id in set().union(*sample_scores):
+        scores = [sample[task_id] for sample in sample_scores if task_id in sample]
+        tasks[task_id] = {
+            "score": round(statistics.mean(scores)),
+            "spread": round(statistics.pstdev(scores), 2),
+        }
     return tasks
 
 
-class OKRAnalyzer:
-    @staticmethod
-    def invoke(payload: InputPayload) -> AnalysisResult:
-        # Build structured prompt with Chain-of-Thought
-        prompt = [
-            {"role": "system", "content": (
-                "You are an analytics assistant tasked with mapping daily tasks to OKRs.\n"
-                "CRITICAL INSTRUCTIONS:\n"
-                "1. First, perform a detailed Chain-of-Thought analysis internally\n"
-                "2. Use the exact JSON schema provided below\n"
-                "3. Never include any text outside the JSON structure\n"
-                "4. Always use the same KR-to-task mapping logic\n\n"
-
-                "ANALYSIS STEPS:\n"
-                "1. For each task, identify its purpose and technical intent\n"
-                "2. Match tasks to KRs based on verbs and objectives\n"
-                "3. Group risks by common themes\n"
-                "4. Derive deliverables from task outcomes\n\n"
-
-                "EXAMPLE COMPLETION (partial):\n"
-                "{\n"
-                "  \"tasks_by_kr\": {\n"
-                "    \"KR1\": {\n"
-                "      \"rezazadeh\": [\"1- پیگیری تیکت های...\", \"2- جلسه با تیم امنیت\"]\n"
-                "    }\n"
-                "  },\n"
-                "  \"risks\": {\n"
-                "    \"KR1\": [\"عدم دسترسی به سرورها\", \"تاخیر در راه اندازی سیستم جدید\"],\n"
-                "    \"KR2\": [\"عدم هماهنگی بین تیم‌ها\", \"مشکلات فنی در ETL\"],\n"
-                "    ...\n"
-                "  },\n"
-                "  \"deliverables\": {\n"
-                "    \"KR1\": [\"گزارش وضعیت سرورهای جدید\", \"روند کاری استاندارد امنیتی\"],\n"
-                "    ...\n"
-                "  }\n"
-                "}\n\n"
-
-
-
-                "ADDITIONAL RULES:\n"
-                "- Maintain consistent person names as given\n"
-                "- Use Persian tasks as-is without translation\n"
-                "- Preserve exact KR identifiers from input\n"
-                "- Prioritize precision over completeness\n"
-                "- Never invent new KRs or tasks"
-            )},
-            {"role": "user", "content": (
-                f"Task table (list of days): {json.dumps([row.tasks for row in payload.task_table], indent=2)}\n"
-                f"OKRs list: {json.dumps([okr.dict() for okr in payload.okrs], indent=2)}"
-            )}
-        ]
+def plan_task_chunks(task_table, budget=None, prompt_format=None):
+    """
+    Split the task table into consecutive day chunks of at most `budget` tokens
+    (default OKR_ANALYSIS_CHUNK_TOKENS). The budget also bounds the reply, which quotes
+    the tasks back, so no chunk runs into the completion limit.
+    Rows are measured as render_task_table puts them in the prompt, in `prompt_format`.
+    A single day larger than the budget becomes its own chunk.
+    """
+    budget = budget or ANALYSIS_CHUNK_TOKENS
+    chunks, current, used = [], [], 0
+    for row in task_table:
+        row_tokens = count_tokens(render_task_table([row], prompt_format))
+        if current and used + row_tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(row)
+        used += row_tokens
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
 
-        try:
-            content = OpenAIClient.chat(
-                prompt,
-                temperature=0,  # Deterministic output
-                seed=42  # Reproducibility
-            )
 
-            print(40 * "#" + "\n" + content + "\n" + 40 * "#")
+def run_chunked_analysis(task_table, build_prompt, budget=None, prompt_format=None):
+    """
+    Map-reduce analysis: `build_prompt(rows)` is run for every token-budgeted chunk of the
+    task table in parallel and the per-chunk results are merged in chunk order.
+    `prompt_format` must be the one `build_prompt` renders the table in.
+    """
+    chunks = plan_task_chunks(task_table, budget, prompt_format)
+    logger.info(f"analysing {len(task_table)} days in {len(chunks)} chunk(s)")
+    if len(chunks) == 1:
+        return _analyze_chunk(build_prompt, chunks[0])
+    with ThreadPoolExecutor(max_workers=min(ANALYSIS_CONCURRENCY, len(chunks))) as pool:
+        results = list(pool.map(propagate(lambda rows: _analyze_chunk(build_prompt, rows)), chunks))
+    return merge_analysis_results(results)
 
-            # Extract JSON from response using triple backticks
-            data = extract_json_from_response(content)
 
-            # Validate required keys exist
-            for key in ["tasks_by_kr", "risks", "deliverables"]:
-                if key not in data:
-                    raise ValueError(f"Missing required key '{key}' in response")
+def _analyze_chunk(build_prompt, rows):
+    try:
+        content = OpenAIClient.chat(
+            build_prompt(rows),
+            temperature=0,  # Deterministic output
+            seed=42,  # Reproducibility
+            raise_on_truncation=True
+        )
+    except TruncatedResponseError:
+        # The reply hit max_tokens: halve the chunk instead of parsing a cut-off answer
+        if len(rows) < 2:
+            raise
+        middle = len(rows) // 2
+        return merge_analysis_results([_analyze_chunk(build_prompt, rows[:middle]),
+                                       _analyze_chunk(build_prompt, rows[middle:])])
+
+    logger.debug(f"analysis reply:\n{content}")
+
+    # Extract JSON from response using triple backticks
+    data = extract_json_from_response(content)
+
+    # Validate required keys exist
+    for key in ["tasks_by_kr", "risks", "deliverables"]:
+        if key not in data:
+            raise ValueError(f"Missing required key '{key}' in response")
+    return data
+
+
+def merge_analysis_results(results):
+    """
+    Merge chunk results in order: task lists are concatenated per KR and person,
+    risks and deliverables per KR, dropping duplicates while keeping first-seen order.
+    """
+    merged = {"tasks_by_kr": {}, "risks": {}, "deliverables": {}}
+    for data in results:
+        for kr_code, persons in data.get("tasks_by_kr", {}).items():
+            merged_persons = merged["tasks_by_kr"].setdefault(kr_code, {})
+            for person, tasks in persons.items():
+                _extend_unique(merged_persons.setdefault(person, []), tasks)
+        for key in ("risks", "deliverables"):
+            for kr_code, items in data.get(key, {}).items():
+                _extend_unique(merged[key].setdefault(kr_code, []), items)
+    return merged
+
 
+def _extend_unique(target, items):
+    for item in items:
+        if item not in target:
+            target.append(item)
+
+
+class OKRAnalyzer:
+    @staticmethod
+    def invoke(payload: InputPayload) -> AnalysisResult:
+        try:
+            data = run_chunked_analysis(payload.task_table, lambda rows: build_analysis_prompt(rows, payload.okrs))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
 
@@ -247,68 +691,10 @@ class OKRAnalyzer:
 
     @staticmethod
     def invoke_for_single_kr(payload: InputPayload, kr_code: str) -> AnalysisResult:
-        # Build structured prompt focused on the single KR
-        prompt = [
-            {"role": "system", "content": (
-                f"You are an analytics assistant tasked with mapping daily tasks to a specific Key Result ({kr_code}).\n"
-                "CRITICAL INSTRUCTIONS:\n"
-                "1. Focus ONLY on tasks related to the provided KR\n"
-                "2. Use the exact JSON schema with the same keys\n"
-                "3. Never include any text outside the JSON structure\n"
-                "4. Prioritize precision over completeness\n"
-                "5. Only return data for the specified KR\n\n"
-
-                "ANALYSIS STEPS:\n"
-                "1. For each task, determine its relevance to the KR's objectives\n"
-                "2. Identify risks directly impacting KR achievement\n"
-                "3. Derive deliverables from completed/documented tasks\n\n"
-
-                "EXAMPLE COMPLETION (partial):\n"
-                "{\n"
-                f"  \"tasks_by_kr\": {{\n"
-                f"    \"{kr_code}\": {{\n"
-                "      \"rezazadeh\": [\"1- پیگیری تیکت های...\", \"2- جلسه با تیم امنیت\"],\n"
-                "      \"kakoolvand\": [\"1- پیگیری تیکت های...\", \"2- جلسه با تیم امنیت\"],\n"
-                "       ..."
-                "    }\n"
-                "  },\n"
-                f"  \"risks\": {{\n"
-                f"    \"{kr_code}\": [\"عدم دسترسی به سرورها\", \"تاخیر در راه اندازی سیستم جدید\"]\n"
-                "  },\n"
-                f"  \"deliverables\": {{\n"
-                f"    \"{kr_code}\": [\"گزارش وضعیت سرورهای جدید\", \"روند کاری استاندارد امنیتی\"]\n"
-                "  }\n"
-                "}\n\n"
-
-                "ADDITIONAL RULES:\n"
-                "- Maintain consistent person names as given\n"
-                "- Use Persian tasks as-is without translation\n"
-                "- Preserve exact KR identifiers from input\n"
-                "- Return empty arrays if no matches found\n"
-            )},
-            {"role": "user", "content": (
-                f"Task table (list of days): {json.dumps([row.tasks for row in payload.task_table], indent=2)}\n"
-                f"Target KR: {json.dumps([okr.dict() for okr in payload.okrs], indent=2)}"
-            )}
-        ]
-
         try:
-            content = OpenAIClient.chat(
-                prompt,
-                temperature=0,  # Deterministic output
-                seed=42  # Reproducibility
-            )
-
-            print(40 * "#" + "\n" + content + "\n" + 40 * "#")
-
-            # Extract JSON from response using triple backticks
-            data = extract_json_from_response(content)
-
-            # Validate required keys exist
-            for key in ["tasks_by_kr", "risks", "deliverables"]:
-                if key not in data:
-                    raise ValueError(f"Missing required key '{key}' in response")
-
+            with metric_labels(kr_code=kr_code):
+                data = run_chunked_analysis(payload.task_table,
+                                            lambda rows: build_single_kr_prompt(rows, payload.okrs, kr_code))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
 
@@ -321,69 +707,11 @@ class OKRAnalyzer:
 
     @staticmethod
     def invoke_for_single_kr_with_description(payload: InputPayload, kr_code: str) -> AnalysisResult:
-        # Build structured prompt focused on the single KR
-        prompt = [
-            {"role": "system", "content": (
-                f"You are an analytics assistant tasked with mapping daily tasks to a specific Key Result ({kr_code}).\n"
-                "CRITICAL INSTRUCTIONS:\n"
-                "1. Focus ONLY on tasks related to the provided KR\n"
-                "2. Use the exact JSON schema with the same keys\n"
-                "3. Never include any text outside the JSON structure\n"
-                "4. Prioritize precision over completeness\n"
-                "5. Only return data for the specified KR\n\n"
-
-                "ANALYSIS STEPS:\n"
-                "1. For each task, determine its relevance to the KR's objectives\n"
-                "2. Identify risks directly impacting KR achievement\n"
-                "3. Derive deliverables from completed/documented tasks\n\n"
-
-                "EXAMPLE COMPLETION (partial):\n"
-                "{\n"
-                f"  \"tasks_by_kr\": {{\n"
-                f"    \"{kr_code}\": {{\n"
-                "      \"rezazadeh\": [\"1- پیگیری تیکت های...\", \"2- جلسه با تیم امنیت\"],\n"
-                "      \"kakoolvand\": [\"1- پیگیری تیکت های...\", \"2- جلسه با تیم امنیت\"],\n"
-                "       ..."
-                "    }\n"
-                "  },\n"
-                f"  \"risks\": {{\n"
-                f"    \"{kr_code}\": [\"عدم دسترسی به سرورها\", \"تاخیر در راه اندازی سیستم جدید\"]\n"
-                "  },\n"
-                f"  \"deliverables\": {{\n"
-                f"    \"{kr_code}\": [\"گزارش وضعیت سرورهای جدید\", \"روند کاری استاندارد امنیتی\"]\n"
-                "  }\n"
-                "}\n\n"
-
-                "ADDITIONAL RULES:\n"
-                "- Maintain consistent person names as given\n"
-                "- Use Persian tasks as-is without translation\n"
-                "- Preserve exact KR identifiers from input\n"
-                "- Return empty arrays if no matches found\n"
-            )},
-            {"role": "user", "content": (
-                f"Task table (list of days): {json.dumps([row.tasks for row in payload.task_table], indent=2)}\n"
-                f"Target KR: {json.dumps([okr.dict() for okr in payload.okrs], indent=2)}"
-                f"KR RELATION with GM OKR: {payload.okrs_text}"
-            )}
-        ]
-
         try:
-            content = OpenAIClient.chat(
-                prompt,
-                temperature=0,  # Deterministic output
-                seed=42  # Reproducibility
-            )
-
-            print(40 * "#" + "\n" + content + "\n" + 40 * "#")
-
-            # Extract JSON from response using triple backticks
-            data = extract_json_from_response(content)
-
-            # Validate required keys exist
-            for key in ["tasks_by_kr", "risks", "deliverables"]:
-                if key not in data:
-                    raise ValueError(f"Missing required key '{key}' in response")
-
+            with metric_labels(kr_code=kr_code):
+                data = run_chunked_analysis(
+                    payload.task_table, lambda rows: build_single_kr_prompt(rows, payload.okrs, kr_code, payload.okrs_text)
+                )
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
 
@@ -395,21 +723,423 @@ class OKRAnalyzer:
         )
 
     @staticmethod
-    def invoke_for_single_kr_with_description_for_split_tasks_3step(db_dic):
-        okr_xlsx = "assets/excel/SPM BI OKR 1404.xlsx"
-        okr_list, _ = load_okrs_with_objective(okr_xlsx, "")
-        persons = get_unique_persons(db_dic["session"], db_dic["Tasks"])
-        for okr in okr_list:
-            _, okr_str = load_okrs_with_objective(okr_xlsx, okr.id)
-            for person in persons:
-                print(okr.description, person)
-                if is_task_kr_person_exist(db_dic["session"], db_dic["TaskScore"], okr.id, person):
+    def invoke_for_single_kr_with_description_for_split_tasks_3step(db_dic, batch_krs=False, prefilter_top_n=None,
+                                                                    incremental=False, on_progress=None,
+                                                                    cancel_event=None, run_id=None
+                                                                    ) -> ScoringRunSummary:
+        """
+        Score the planned (KR, person) work items one after the other and save each result.
+
+        The run is kept in the scoring_work_items ledger (see start_scoring_run), so passing the
+        `run_id` of a stopped run resumes it where it stopped. A pair that fails is retried after OKR_QUEUE_RETRY_DELAY
+        instead of aborting the run, and reported as failed after OKR_QUEUE_MAX_ATTEMPTS.
+        """
+        session = db_dic["session"]
+        summary = ScoringRunSummary(run_id=start_scoring_run(db_dic, run_id, batch_krs, prefilter_top_n,
+                                                             incremental))
+        _count_run_pairs(session, summary)
+        _report_progress(on_progress, summary)
+        worker_id = new_worker_id()
+        scored = False
+        while not (cancel_event is not None and cancel_event.is_set()):
+            item = claim_work_item(session, worker_id, summary.run_id)
+            if item is None:
+                if is_run_finished(session, summary.run_id):
+                    break
+                # Retries not due yet, or items leased by a process that stopped
+                if cancel_event is not None:
+                    cancel_event.wait(QUEUE_POLL_SECONDS)
+                else:
+                    time.sleep(QUEUE_POLL_SECONDS)
+                continue
+            logger.info(f"scoring {[okr.id for okr in item.okrs]} for {item.person}, attempt {item.attempts}")
+            try:
+                with LeaseHeartbeat(item.id, worker_id), \
+                        metric_labels(kr_code=_kr_label(item.okrs), person=item.person):
+                    scored_by_kr = score_work_item(item.okrs, item.task_text)
+                for kr_code, scored_tasks in scored_by_kr.items():
+                    save_scores_in_db(scored_tasks, session, db_dic["TaskScore"], kr_code, item.person, item.task_ids)
+            except Exception as e:
+                session.rollback()
+                _record_failure(session, item, worker_id, e, summary)
+            else:
+                complete_work_item(session, item.id, worker_id)
+                summary.pairs_scored += len(scored_by_kr)
+                scored = True
+            _report_progress(on_progress, summary)
+        summary.cancelled = cancel_event is not None and cancel_event.is_set()
+        if scored:
+            refresh_score_rollups(session)
+        return summary
+
+    @staticmethod
+    async def invoke_for_single_kr_with_description_for_split_tasks_3step_async(db_dic, max_concurrency=None,
+                                                                                  batch_krs=False,
+                                                                                  prefilter_top_n=None,
+                                                                                  incremental=False,
+                                                                                  on_progress=None,
+                                                                                  cancel_event=None,
+                                                                                  run_id=None
+                                                                                  ) -> ScoringRunSummary:
+        """
+        Concurrent version of invoke_for_single_kr_with_description_for_split_tasks_3step.
+
+        All (KR, person) pairs that have no scores yet are scored in parallel, with at most
+        `max_concurrency` (default OKR_SCORING_CONCURRENCY) LLM scoring runs in flight.
+        Pairs are tracked in the run ledger like in the sequential version: `run_id` resumes
+        (and retries the failed pairs of) a given run, failures are retried and never abort the run.
+        With `batch_krs`, each work item is a token-budgeted group of KRs for one person;
+        with `incremental`, only tasks without a score for the KR are sent (see plan_scoring_work).
+        `on_progress(pairs_scored, pairs_total)` is called as pairs finish, and setting the
+        threading.Event `cancel_event` stops the run. Planning and DB reads and writes run on
+        one dedicated thread, so the session is never shared and the event loop is never blocked.
+        """
+        summary = ScoringRunSummary()
+        async for _ in stream_scoring_run(db_dic, summary, max_concurrency, batch_krs, prefilter_top_n,
+                                          incremental, on_progress, cancel_event, run_id):
+            pass
+        return summary
+
+    @staticmethod
+    async def stream_single_kr_analyses(payload: InputPayload, max_concurrency=None):
+        """
+        Run invoke_for_single_kr for every OKR of the payload concurrently and yield
+        {"kr_code", "kr_name", "kr_result"} (or {"kr_code", "error"}) as each KR finishes.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or SCORING_CONCURRENCY)
+
+        async def analyze(okr):
+            kr_payload = InputPayload(task_table=payload.task_table, okrs=[okr])
+            async with semaphore:
+                try:
+                    result = await asyncio.to_thread(OKRAnalyzer.invoke_for_single_kr, kr_payload, okr.id)
+                    return {"kr_code": okr.id, "kr_name": okr.description, "kr_result": result.model_dump()}
+                except Exception as e:
+                    return {"kr_code": okr.id, "kr_name": okr.description,
+                            "error": getattr(e, "detail", None) or str(e)}
+
+        pending = [asyncio.ensure_future(analyze(okr)) for okr in payload.okrs]
+        try:
+            for future in asyncio.as_completed(pending):
+                yield await future
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+async def stream_scoring_run(db_dic, summary=None, max_concurrency=None, batch_krs=False, prefilter_top_n=None,
+                             incremental=False, on_progress=None, cancel_event=None, run_id=None):
+    """
+    Engine behind the async 3-step scoring run: scores the run's ledger items concurrently,
+    saves each result and yields {"kr_code", "person", "scores"} as soon as it is stored, or
+    {"kr_code", "person", "error"} for a pair that failed on every attempt.
+    Counters are kept in `summary` (a ScoringRunSummary) when one is passed.
+    Planning and all DB work run on one dedicated thread that owns the session, so the event
+    loop keeps serving other requests meanwhile. With single-sample scoring (OKR_SCORING_SAMPLES=1)
+    replies are streamed and their scores saved as they arrive; an item that fails halfway keeps
+    the scores already saved until its retry overwrites them.
+    """
+    summary = summary if summary is not None else ScoringRunSummary()
+    max_concurrency = max_concurrency or SCORING_CONCURRENCY
+    session = db_dic["session"]
+    loop = asyncio.get_running_loop()
+    db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scoring-db")
+
+    def db(fn, *args):
+        return loop.run_in_executor(db_executor, propagate(fn), *args)
+
+    async def score_item(item):
+        # (all scores, scores not saved yet); streamed items save their entries as they arrive
+        with metric_labels(kr_code=_kr_label(item.okrs), person=item.person):
+            if not can_stream_work_item():
+                scored_by_kr = await score_work_item_async(item.okrs, item.task_text)
+                return scored_by_kr, scored_by_kr
+            scored_by_kr = {okr.id: {} for okr in item.okrs}
+            async for batch in stream_work_item_scores(item.okrs, item.task_text):
+                await db(save_scores, item, batch)
+                for kr_code, scored_tasks in batch.items():
+                    scored_by_kr.setdefault(kr_code, {}).update(scored_tasks)
+            return scored_by_kr, {}
+
+    def save_scores(item, scored_by_kr):
+        for kr_code, scored_tasks in scored_by_kr.items():
+            logger.debug(f"{kr_code} {item.person}: {scored_tasks}")
+            save_scores_in_db(scored_tasks, session, db_dic["TaskScore"], kr_code, item.person, item.task_ids)
+
+    def save_item(item, unsaved_by_kr):
+        save_scores(item, unsaved_by_kr)
+        complete_work_item(session, item.id, worker_id)
+
+    def record_failure(item, error):
+        session.rollback()
+        return _record_failure(session, item, worker_id, error, summary)
+
+    def finish_run(unfinished):
+        # Unfinished items go back to pending, so resuming the run picks them up right away
+        for item in unfinished:
+            release_work_item(session, item.id, worker_id)
+        if scored:
+            refresh_score_rollups(session)
+
+    worker_id = new_worker_id()
+    in_flight = {}  # future -> ClaimedItem
+    next_claim = 0.0  # after an empty claim, wait QUEUE_POLL_SECONDS before asking again
+    last_heartbeat = time.monotonic()
+    scored = False
+    try:
+        summary.run_id = await db(start_scoring_run, db_dic, run_id, batch_krs, prefilter_top_n, incremental)
+        await db(_count_run_pairs, session, summary)
+        logger.info(f"run {summary.run_id}: {summary.requests} scoring requests, concurrency {max_concurrency}")
+        _report_progress(on_progress, summary)
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                summary.cancelled = True
+                break
+            finished = False
+            while len(in_flight) < max_concurrency and time.monotonic() >= next_claim:
+                item = await db(claim_work_item, session, worker_id, summary.run_id)
+                if item is None:
+                    finished = not in_flight and await db(is_run_finished, session, summary.run_id)
+                    next_claim = time.monotonic() + QUEUE_POLL_SECONDS
+                    break
+                in_flight[asyncio.ensure_future(score_item(item))] = item
+            if finished:
+                break
+            if not in_flight:
+                await asyncio.sleep(0.5)
+                continue
+            # Wake up periodically so a cancellation is noticed while requests are in flight
+            done, _ = await asyncio.wait(in_flight, timeout=0.5, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                next_claim = 0.0
+                try:
+                    scored_by_kr, unsaved_by_kr = future.result()
+                    await db(save_item, item, unsaved_by_kr)
+                except Exception as e:
+                    for event in await db(record_failure, item, e):
+                        yield event
+                    _report_progress(on_progress, summary)
+                    continue
+                summary.pairs_scored += len(scored_by_kr)
+                scored = True
+                _report_progress(on_progress, summary)
+                for kr_code, scored_tasks in scored_by_kr.items():
+                    yield {"kr_code": kr_code, "person": item.person, "scores": scored_tasks}
+            if in_flight and time.monotonic() - last_heartbeat >= QUEUE_HEARTBEAT_SECONDS:
+                for item in in_flight.values():
+                    await db(heartbeat, session, item.id, worker_id)
+                last_heartbeat = time.monotonic()
+    finally:
+        for future in in_flight:
+            future.cancel()
+        finish = db(finish_run, list(in_flight.values()))
+        try:
+            await asyncio.shield(finish)
+        except asyncio.CancelledError:
+            # The caller closes the session once we return, so wait for the DB thread without
+            # blocking the event loop (asyncio.wait does not cancel `finish`), then re-raise
+            await asyncio.wait({finish})
+            raise
+        finally:
+            db_executor.shutdown(wait=False)
+
+
+def start_scoring_run(db_dic, run_id=None, batch_krs=False, prefilter_top_n=None, incremental=False) -> str:
+    """
+    Run id of the 3-step scoring run to work on. A given `run_id` is resumed with its failed
+    pairs queued again; otherwise a new run is planned into the ledger with the given parameters.
+    Unfinished runs are never picked up implicitly: they may have been planned with other
+    parameters, or queued for worker.py processes with POST /queue/analyze_v2.
+    """
+    session = db_dic["session"]
+    if run_id is not None and run_status(session, run_id).total:
+        retried = retry_failed_items(session, run_id)
+        logger.info(f"resuming run {run_id}, {retried} failed items queued again")
+        return run_id
+    run_id, items = enqueue_scoring_run(db_dic, run_id, batch_krs, prefilter_top_n, incremental)
+    logger.info(f"run {run_id}: {items} items planned")
+    return run_id
+
+
+def _count_run_pairs(session, summary):
+    pairs = run_pair_counts(session, summary.run_id)
+    summary.requests = run_status(session, summary.run_id).total
+    summary.pairs_total = sum(pairs.values())
+    summary.pairs_scored = pairs.get("done", 0)
+    summary.pairs_failed = pairs.get("failed", 0)
+
+
+def _report_progress(on_progress, summary):
+    # Failed pairs count as processed, so progress and ETA still reach the end of the run
+    if on_progress:
+        on_progress(summary.pairs_scored + summary.pairs_failed, summary.pairs_total)
+
+
+def _record_failure(session, item, worker_id, error, summary):
+    """
+    Record a failed attempt of a claimed item in the ledger. Returns the error events of its
+    pairs when the item has no attempts left, else an empty list (it will be retried).
+    """
+    error = getattr(error, "detail", None) or str(error)
+    status = fail_work_item(session, item.id, worker_id, error)
+    codes = [okr.id for okr in item.okrs]
+    if status != "failed":
+        logger.warning(f"{codes} for {item.person} failed (attempt {item.attempts}), will be retried: {error}")
+        return []
+    logger.error(f"{codes} for {item.person} failed after {item.attempts} attempts: {error}")
+    summary.pairs_failed += len(codes)
+    return [{"kr_code": kr_code, "person": item.person, "error": error} for kr_code in codes]
+
+
+def plan_scoring_work(db_dic, okr_list, persons, batch_krs=False, prefilter_top_n=None, incremental=False):
+    """
+    Build the (okr_group, person, task_text, task_ids) work items of a 3-step scoring run.
+
+    By default pairs that already have scores are skipped. With `incremental`, every pair is
+    considered but only its tasks without a task_scores row for that KR are sent, so a daily
+    run only pays for the new tasks. Each group holds one KR, or with `batch_krs` a
+    token-budgeted group of KRs that share the same task list. With `prefilter_top_n`
+    (default OKR_PREFILTER_TOP_N, 0 = off) only the tasks the lexical task index shortlists
+    for the group's KRs among the tasks being planned are sent to the LLM; tasks left out get no
+    task_scores row, so incremental runs rank them again (lexically, no LLM call) with the new tasks.
+    """
+    session = db_dic["session"]
+    prefilter_top_n = PREFILTER_TOP_N if prefilter_top_n is None else prefilter_top_n
+    task_index = load_task_index(session, db_dic["Tasks"]) if prefilter_top_n else None
+    if incremental:
+        unscored = get_unscored_tasks(session, db_dic["Tasks"], db_dic["TaskScore"], [okr.id for okr in okr_list])
+
+    work_items = []
+    for person in persons:
+        # KRs of this person grouped by the task list that still needs scoring
+        pending = {}
+        if incremental:
+            for okr in okr_list:
+                tasks = unscored.get((okr.id, person))
+                if tasks:
+                    pending.setdefault(tuple(task.id for task in tasks), (tasks, []))[1].append(okr)
+        else:
+            okrs = [okr for okr in okr_list
+                    if not is_task_kr_person_exist(session, db_dic["TaskScore"], okr.id, person)]
+            if okrs:
+                pending[None] = (get_person_tasks(session, db_dic["Tasks"], person), okrs)
+
+        for tasks_for_person, okrs in pending.values():
+            task_text = render_person_tasks(tasks_for_person, person)
+            if batch_krs:
+                okr_groups = plan_kr_batches(okrs, task_text, len(tasks_for_person))
+            else:
+                okr_groups = [[okr] for okr in okrs]
+            task_ids = [task.id for task in tasks_for_person]
+            for okr_group in okr_groups:
+                if task_index is None:
+                    work_items.append((okr_group, person, task_text, task_ids))
                     continue
-                print("checkpoint 1")
-                tasks_for_person = get_person_tasks(db_dic["session"], db_dic["Tasks"], person)
-                task_text = create_person_task_text(tasks_for_person, person)
-                scored_tasks = get_initial_tasks(task_text, okr.id, okr.description)
-                save_scores_in_db(scored_tasks, db_dic["session"], db_dic["TaskScore"], okr.id, person)
+                candidates = _prefilter_tasks(task_index, tasks_for_person, person, okr_group, prefilter_top_n)
+                if candidates:
+                    work_items.append((okr_group, person, render_person_tasks(candidates, person),
+                                       [task.id for task in candidates]))
+    return work_items
+
+
+def enqueue_scoring_run(db_dic, run_id=None, batch_krs=False, prefilter_top_n=None, incremental=False):
+    """
+    Plan a 3-step scoring run into the scoring_work_items queue for worker.py processes.
+    Returns (run_id, items queued).
+    """
+    run_id = run_id or uuid.uuid4().hex[:12]
+    okr_list, _ = load_okrs_with_objective(SPM_OKR_XLSX, "")
+    persons = get_unique_persons(db_dic["session"], db_dic["Tasks"])
+    work_items = plan_scoring_work(db_dic, okr_list, persons, batch_krs, prefilter_top_n, incremental)
+    return run_id, add_work_items(db_dic["session"], run_id, work_items)
+
+
+def _prefilter_tasks(task_index, tasks_for_person, person, okrs, top_n):
+    # Keep the tasks the index shortlists for at least one KR of the group. Only the tasks still to
+    # be scored are ranked, so in incremental runs new tasks do not compete with already-scored ones
+    pending_ids = [task.id for task in tasks_for_person]
+    candidate_ids = set()
+    for okr in okrs:
+        candidate_ids.update(task_index.shortlist(okr.description, top_n, person=person, task_ids=pending_ids))
+    return [task for task in tasks_for_person if task.id in candidate_ids]
+
+
+def _kr_label(okr_group):
+    # Metrics label of a work item; batched groups are not split per KR
+    return okr_group[0].id if len(okr_group) == 1 else "batch"
+
+
+def score_work_item(okr_group, task_text):
+    # Returns {kr_code: scored_tasks} for a single KR or a batched KR group
+    if len(okr_group) == 1:
+        okr = okr_group[0]
+        return {okr.id: get_initial_tasks(task_text, okr.id, okr.description)}
+    return get_batched_scores(task_text, okr_group)
+
+
+async def score_work_item_async(okr_group, task_text):
+    if len(okr_group) == 1:
+        okr = okr_group[0]
+        return {okr.id: await get_initial_tasks_async(task_text, okr.id, okr.description)}
+    return await get_batched_scores_async(task_text, okr_group)
+
+
+def can_stream_work_item():
+    # Streaming replaces sampling, so only single-sample scoring streams
+    return SCORING_SAMPLES == 1 and SCORING_STREAM_SAVE_EVERY > 0
+
+
+async def stream_work_item_scores(okr_group, task_text, save_every=None):
+    """
+    Single-sample scoring of a work item over a streamed completion. Yields
+    {kr_code: {task_id: {"score", "spread"}}} batches of `save_every` entries (default
+    OKR_SCORING_STREAM_SAVE_EVERY) as they arrive, so callers can save scores before the reply ends.
+    A reply cut off at max_tokens yields the entries that arrived complete.
+    """
+    save_every = save_every or SCORING_STREAM_SAVE_EVERY
+    prompt, chat_params, items_key, parse_entry = _streaming_request(okr_group, task_text)
+    parser = StreamingJSONParser(items_key)
+    batch, entries = {}, 0
+    async for delta in AsyncOpenAIClient.chat_stream(prompt, temperature=0, seed=42, **chat_params):
+        for array_key, item in parser.feed(delta):
+            entry = parse_entry(array_key, item)
+            if entry is None:
+                continue
+            kr_code, task_id, score = entry
+            batch.setdefault(kr_code, {})[task_id] = {"score": round(score), "spread": 0.0}
+            entries += 1
+            if entries % save_every == 0:
+                yield batch
+                batch = {}
+    if batch:
+        yield batch
+    if not entries:
+        raise HTTPException(status_code=500, detail="Analysis failed: no scores in the streamed reply")
+
+
+def _streaming_request(okr_group, task_text):
+    # (prompt, chat params, array key, entry parser) of the request score_work_item_async would send
+    if len(okr_group) > 1:
+        kr_codes = {okr.id for okr in okr_group}
+
+        def parse_batched(kr_code, task):
+            entry = _score_entry(task.get("id"), task.get("score")) if isinstance(task, dict) else None
+            return (kr_code, *entry) if entry is not None and kr_code in kr_codes else None
+        return build_batched_prompt(task_text, okr_group), {}, "kr_scores", parse_batched
+
+    okr = okr_group[0]
+    prompt, parse, chat_params = _scoring_request(task_text, okr.id, okr.description)
+    if parse is _parse_score_pairs:
+        def parse_pair(_, pair):
+            entry = _score_entry(pair[0], pair[1]) if isinstance(pair, list) and len(pair) >= 2 else None
+            return (okr.id, *entry) if entry is not None else None
+        return prompt, chat_params, "scores", parse_pair
+
+    def parse_task(_, task):
+        entry = _score_entry(task.get("id"), task.get("score")) if isinstance(task, dict) else None
+        return (okr.id, *entry) if entry is not None else None
+    return prompt, chat_params, "all_task_scores", parse_task
 
 
 #defining a runnable class to invoke the analyzer
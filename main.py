@@ -1,15 +1,32 @@
-from fastapi import FastAPI
+import logging
+import os
+from typing import List
 
-from models.ps_sql_schema import get_task_db
-from models.schemas import InputPayload, AnalysisResult
-from core.analyzer import OKRAnalyzer, OKRClassifier
-from utils.excel_reader import run_analysis_cli, load_okrs
+from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.analyzer import OKRAnalyzer
-from utils.excel_reader import run_analysis_cli, run_analysis_cli_with_description
+from core.analyzer import OKRAnalyzer, OKRClassifier, stream_scoring_run, enqueue_scoring_run, PROMPT_FORMAT, \
+    ANALYSIS_CHUNK_TOKENS
+from models.ps_sql_schema import get_db_dic, get_task_db, get_async_db
+from models.schemas import AnalysisResult, ScoringRunSummary, JobStatus, RunMetrics, QueueRunStatus
+from services import metrics, score_queries
+from services.jobs import job_manager, run_scoring_job
+from services.openai_client import AZURE_OPENAI_DEPLOYMENT
+from services.result_cache import result_cache
+from services.score_queries import ScoreJSONResponse
+from services.streaming import stream_events
+from services.work_queue import run_status
+from utils.excel_reader import run_analysis_cli, run_analysis_cli_with_description, load_okrs, TASK_XLSX, OKR_XLSX, \
+    SPM_OKR_XLSX
+
+logging.basicConfig(level=os.getenv("OKR_LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per LLM request otherwise
 
 app = FastAPI()
-db_dic = get_task_db()
+
+# Settings a cached per-KR result depends on besides the workbooks
+ANALYSIS_SETTINGS = (AZURE_OPENAI_DEPLOYMENT, PROMPT_FORMAT, ANALYSIS_CHUNK_TOKENS)
 
 
 @app.get("/analyze", response_model=AnalysisResult)
@@ -19,54 +36,238 @@ def analyze():
     along with identified risks and deliverables for each OKR.
     """
     print("api called")
-    payload = run_analysis_cli()
-    return OKRAnalyzer.invoke(payload)
+    with metrics.track_run("analyze"):
+        payload = run_analysis_cli()
+        return OKRAnalyzer.invoke(payload)
 
 
-@app.get("/analyze_v2", response_model=AnalysisResult)
-def analyze():
+@app.get("/analyze/stream")
+def analyze_stream(format: str = "ndjson"):
     """
-    Analyze team daily tasks against OKRs and return mapping of tasks to OKRs,
-    along with identified risks and deliverables for each OKR.
+    Streaming variant of /analyze: each KR is analysed on its own and its tasks, risks and
+    deliverables are sent as soon as it completes, as NDJSON (format=ndjson) or
+    Server-Sent Events (format=sse).
+    """
+    with metrics.metric_labels(endpoint="analyze/stream"):
+        payload = run_analysis_cli()
+
+    async def events():
+        with metrics.track_run("analyze/stream"):
+            async for event in OKRAnalyzer.stream_single_kr_analyses(payload):
+                yield event
+
+    return stream_events(events(), format)
+
+
+@app.get("/analyze_v2", response_model=ScoringRunSummary)
+async def analyze(batch_krs: bool = False, prefilter_top_n: int = None, incremental: bool = False,
+                  run_id: str = None, db_dic: dict = Depends(get_db_dic)):
+    """
+    Score every task against every KR (per person) and store the scores in task_scores.
+    Runs inside the request; use POST /jobs/analyze_v2 for long runs.
+    Set batch_krs=true to score each person's tasks against token-budgeted groups of KRs per request.
+    Set prefilter_top_n to only send each person's top-N lexically matching tasks per KR to the LLM.
+    Set incremental=true to score only tasks that have no score for a KR yet.
+    Pass the run_id of an interrupted run (returned in the summary) to resume it and retry its
+    failed pairs; the parameters above only apply when a new run is planned.
     """
     print("api called")
-    return OKRAnalyzer.invoke_for_single_kr_with_description_for_split_tasks_3step(db_dic)
+    with metrics.track_run("analyze_v2"):
+        return await OKRAnalyzer.invoke_for_single_kr_with_description_for_split_tasks_3step_async(
+            db_dic, batch_krs=batch_krs, prefilter_top_n=prefilter_top_n, incremental=incremental, run_id=run_id
+        )
+
+
+@app.get("/analyze_v2/stream")
+def analyze_v2_stream(format: str = "ndjson", batch_krs: bool = False, prefilter_top_n: int = None,
+                      incremental: bool = False, run_id: str = None):
+    """
+    Streaming variant of /analyze_v2: every (KR, person) score set is sent as soon as it is
+    stored, as NDJSON (format=ndjson) or Server-Sent Events (format=sse).
+    """
+    summary = ScoringRunSummary()
+
+    async def events():
+        # The session must outlive the request handler, so the stream owns it
+        db_dic = get_task_db()
+        try:
+            with metrics.track_run("analyze_v2/stream"):
+                async for event in stream_scoring_run(db_dic, summary, batch_krs=batch_krs,
+                                                      prefilter_top_n=prefilter_top_n, incremental=incremental,
+                                                      run_id=run_id):
+                    yield event
+        finally:
+            db_dic["session"].close()
+
+    return stream_events(events(), format, summary=summary.model_dump)
+
+
+@app.post("/jobs/analyze_v2", response_model=JobStatus, status_code=202)
+def submit_analyze_v2_job(batch_krs: bool = False, prefilter_top_n: int = None, incremental: bool = False,
+                          run_id: str = None):
+    """
+    Start the /analyze_v2 scoring run in the background and return its job id right away.
+    Poll GET /jobs/{job_id} for progress.
+    """
+    return job_manager.submit("analyze_v2", run_scoring_job, batch_krs=batch_krs,
+                              prefilter_top_n=prefilter_top_n, incremental=incremental, run_id=run_id)
+
+
+@app.post("/queue/analyze_v2", response_model=QueueRunStatus, status_code=202)
+def enqueue_analyze_v2(batch_krs: bool = False, prefilter_top_n: int = None, incremental: bool = False,
+                       db_dic: dict = Depends(get_db_dic)):
+    """
+    Plan the /analyze_v2 scoring run into the shared work queue for `python worker.py` processes,
+    which may run on other machines. Poll GET /queue/runs/{run_id} for progress.
+    """
+    run_id, _ = enqueue_scoring_run(db_dic, batch_krs=batch_krs, prefilter_top_n=prefilter_top_n,
+                                    incremental=incremental)
+    return run_status(db_dic["session"], run_id)
+
+
+@app.get("/queue/runs/{run_id}", response_model=QueueRunStatus)
+def get_queue_run(run_id: str, db_dic: dict = Depends(get_db_dic)):
+    """
+    Work items of a queued run per state, with the errors of the failed ones.
+    """
+    status = run_status(db_dic["session"], run_id)
+    if not status.total:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    return status
+
+
+@app.get("/jobs", response_model=List[JobStatus])
+def list_jobs():
+    return job_manager.list()
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job(job_id: str):
+    """
+    Status of a background job: pairs done/remaining, ETA, result or error.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.delete("/jobs/{job_id}", response_model=JobStatus)
+def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job. Scores already saved are kept.
+    """
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.get("/scores/krs", response_class=ScoreJSONResponse)
+async def scores_by_kr(limit: int = Query(100, ge=1, le=score_queries.MAX_PAGE_SIZE), offset: int = Query(0, ge=0),
+                       session: AsyncSession = Depends(get_async_db)):
+    """
+    Stored score summary per KR (people, tasks scored, relevant tasks, average score), from the rollups.
+    """
+    return await session.run_sync(score_queries.kr_summaries, limit, offset)
+
+
+@app.get("/scores/kr/{kr_code}", response_class=ScoreJSONResponse)
+async def scores_for_kr(kr_code: str, day_from: str = None, day_to: str = None,
+                        limit: int = Query(100, ge=1, le=score_queries.MAX_PAGE_SIZE), offset: int = Query(0, ge=0),
+                        session: AsyncSession = Depends(get_async_db)):
+    """
+    Per-person stored scores of one KR; day_from/day_to (e.g. 14040201) limit the days counted.
+    """
+    return await session.run_sync(score_queries.kr_scores, kr_code, day_from, day_to, limit, offset)
+
+
+@app.get("/scores/kr/{kr_code}/top-tasks", response_class=ScoreJSONResponse)
+async def top_tasks_for_kr(kr_code: str, person: str = None, day_from: str = None, day_to: str = None,
+                           min_score: int = Query(0, ge=0, le=100),
+                           limit: int = Query(20, ge=1, le=score_queries.MAX_PAGE_SIZE), offset: int = Query(0, ge=0),
+                           session: AsyncSession = Depends(get_async_db)):
+    """
+    Highest-scoring tasks of one KR, optionally for one person and a day range.
+    """
+    return await session.run_sync(score_queries.top_tasks, kr_code, person, day_from, day_to, min_score,
+                                  limit, offset)
+
+
+@app.get("/scores/person/{person}", response_class=ScoreJSONResponse)
+async def scores_for_person(person: str, day_from: str = None, day_to: str = None,
+                            limit: int = Query(100, ge=1, le=score_queries.MAX_PAGE_SIZE), offset: int = Query(0, ge=0),
+                            session: AsyncSession = Depends(get_async_db)):
+    """
+    Per-KR stored scores of one person; day_from/day_to limit the days counted.
+    """
+    return await session.run_sync(score_queries.person_scores, person, day_from, day_to, limit, offset)
 
 
 @app.get("/analyze-kr/{kr_code}")
-def analyze_kr(kr_code: str):
+def analyze_kr(kr_code: str, refresh: bool = False):
     """
     Analyze team daily tasks for a specific Key Result (KR) and return:
     - Tasks mapped to the KR
     - Identified risks
     - Deliverables for the KR
+    Results are cached until either workbook changes; refresh=true recomputes.
     """
     print(f"API called for KR: {kr_code}")
-    kr_info = {}
-    # Load full payload first
-    payload = run_analysis_cli()
 
-    kr_info["kr_name"] = [okr.description for okr in payload.okrs if okr.id == kr_code][0]
-    kr_info["kr_result"] = OKRAnalyzer.invoke_for_single_kr(payload, kr_code)
-    return kr_info
+    def compute():
+        kr_info = {}
+        with metrics.track_run("analyze-kr"):
+            # Load full payload first
+            payload = run_analysis_cli()
+
+            kr_info["kr_name"] = [okr.description for okr in payload.okrs if okr.id == kr_code][0]
+            kr_info["kr_result"] = OKRAnalyzer.invoke_for_single_kr(payload, kr_code).model_dump()
+        return kr_info
+
+    return result_cache.get_or_compute("analyze-kr", kr_code, (TASK_XLSX, OKR_XLSX), compute,
+                                       ANALYSIS_SETTINGS, refresh)
 
 
 @app.get("/analyze-kr_with_description/{kr_code}")
-def analyze_kr(kr_code: str):
+def analyze_kr(kr_code: str, refresh: bool = False):
     """
     Analyze team daily tasks for a specific Key Result (KR) and return:
     - Tasks mapped to the KR
     - Identified risks
     - Deliverables for the KR
+    Results are cached until either workbook changes; refresh=true recomputes.
     """
     print(f"API called for KR: {kr_code}")
-    kr_info = {}
-    # Load full payload first
-    payload = run_analysis_cli_with_description(kr_code=kr_code)
 
-    kr_info["kr_name"] = [okr.description for okr in payload.okrs if okr.id == kr_code][0]
-    kr_info["kr_result"] = OKRAnalyzer.invoke_for_single_kr(payload, kr_code)
-    return kr_info
+    def compute():
+        kr_info = {}
+        with metrics.track_run("analyze-kr_with_description"):
+            # Load full payload first
+            payload = run_analysis_cli_with_description(kr_code=kr_code)
+
+            kr_info["kr_name"] = [okr.description for okr in payload.okrs if okr.id == kr_code][0]
+            kr_info["kr_result"] = OKRAnalyzer.invoke_for_single_kr(payload, kr_code).model_dump()
+        return kr_info
+
+    return result_cache.get_or_compute("analyze-kr_with_description", kr_code, (TASK_XLSX, SPM_OKR_XLSX), compute,
+                                       ANALYSIS_SETTINGS, refresh)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Stage timings, LLM requests, tokens and cost in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/runs", response_model=List[RunMetrics])
+def recent_run_metrics():
+    """
+    Summaries of the most recent runs (wall time, calls, tokens, cost, time per stage).
+    """
+    return metrics.recent_runs()
 
 
 @app.get('/kr-classifier')
@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import Any, List, Dict, Optional
 from pydantic import BaseModel
 
 
@@ -27,3 +27,62 @@ class AnalysisResult(BaseModel):
     risks: Dict[str, List[str]]
     deliverables: Dict[str, List[str]]
 
+
+
+class KRContext(BaseModel):
+    code: str
+    objective: Optional[str]  # GM objective the KR belongs to
+    gm_kr: Optional[str]  # parent GM key result
+    description: str  # BI key result text
+    kr_description: Optional[str]  # free-text description column of the workbook
+    context_text: str  # Objective -> GM KR -> BI KR text used in prompts
+
+
+class ScoringRunSummary(BaseModel):
+    run_id: Optional[str] = None  # ledger run in scoring_work_items, see GET /queue/runs/{run_id}
+    requests: int = 0  # LLM scoring requests planned (one per KR or KR group)
+    pairs_total: int = 0  # (KR, person) pairs planned
+    pairs_scored: int = 0  # including pairs finished before the run was resumed
+    pairs_failed: int = 0  # pairs that failed on every attempt
+    cancelled: bool = False
+
+
+class RunMetrics(BaseModel):
+    run_id: str
+    endpoint: str
+    status: str = "running"  # running, succeeded, failed
+    started_at: float
+    wall_seconds: float = 0.0
+    llm_calls: int = 0
+    cached_calls: int = 0
+    failed_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    stage_seconds: Dict[str, float] = {}  # summed over concurrent calls, so may exceed wall_seconds
+
+
+class QueueRunStatus(BaseModel):
+    run_id: str
+    total: int = 0  # work items (one per KR or KR group and person)
+    pending: int = 0
+    running: int = 0
+    done: int = 0
+    failed: int = 0
+    failures: List[Dict[str, Any]] = []  # kr_codes, person, attempts, last_error of failed items
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str  # queued, running, succeeded, failed, cancelled
+    params: Dict[str, Any] = {}
+    pairs_done: int = 0
+    pairs_total: int = 0
+    pairs_remaining: int = 0
+    eta_seconds: Optional[float] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[ScoringRunSummary] = None
@@ -1,8 +1,29 @@
+from sqlalchemy import String, exists, insert, literal, select, true, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from services.metrics import timed
+
+
 def is_day_in_db(session, Tasks, day_str):
     result = session.query(Tasks).filter(Tasks.day == day_str).first()
     return result is not None
 
 
+def get_existing_days(session, Tasks):
+    # All days already ingested, in one query instead of one is_day_in_db call per day
+    return {day for (day,) in session.query(Tasks.day).distinct()}
+
+
+@timed("db_write")
+def bulk_insert_tasks(session, Tasks, rows):
+    """
+    Insert task dicts ({"day", "person", "task"}) with a single executemany and commit.
+    """
+    if rows:
+        session.execute(insert(Tasks), rows)
+    session.commit()
+
+
 def is_task_kr_person_exist(session, TaskScore, kr_code, person):
     result = session.query(TaskScore).filter(
         TaskScore.kr_code == kr_code,
@@ -11,6 +32,32 @@ def is_task_kr_person_exist(session, TaskScore, kr_code, person):
     return result is not None
 
 
+def get_unscored_tasks(session, Tasks, TaskScore, kr_codes, person=None):
+    """
+    Tasks that have no task_scores row for a KR yet, as {(kr_code, person): [Tasks, ...]}.
+
+    One anti-join query over tasks x kr_codes, so an incremental run only looks at
+    tasks added since the last scoring run (plus any gaps) instead of the whole history.
+    """
+    if not kr_codes:
+        return {}
+    # KR codes as a derived table of literal selects; VALUES lists in FROM are not portable to SQLite
+    kr = union_all(*[select(literal(kr_code, String(50)).label("kr_code")) for kr_code in kr_codes]
+                   ).subquery("kr_codes")
+    query = (
+        session.query(Tasks, kr.c.kr_code)
+        .join(kr, true())
+        .filter(~exists().where(TaskScore.task_id == Tasks.id, TaskScore.kr_code == kr.c.kr_code))
+    )
+    if person is not None:
+        query = query.filter(Tasks.person == person)
+
+    unscored = {}
+    for task, kr_code in query.order_by(Tasks.id):
+        unscored.setdefault((kr_code, task.person), []).append(task)
+    return unscored
+
+
 def get_person_tasks(session, Tasks, person):
     tasks_for_person = session.query(Tasks).filter_by(person=person).all()
     return tasks_for_person
@@ -31,16 +78,49 @@ def get_unique_persons(session, Tasks):
         print(f"Error retrieving persons: {str(e)}")
 
 
-def save_scores_in_db(scored_tasks, session, taskscore, kr_code, person):
-    score_records = [
-        taskscore(
-            task_id=task_id,
-            kr_code=kr_code,
-            score=scored_tasks[task_id],
-            person=person,
-        ) for task_id in scored_tasks.keys()
+@timed("db_write")
+def save_scores_in_db(scored_tasks, session, taskscore, kr_code, person, task_ids=None):
+    """
+    Upsert one row per (task_id, kr_code): re-scoring a pair overwrites its score instead of
+    adding duplicates. scored_tasks maps task_id -> {"score": mean, "spread": std dev} (or a bare score).
+    With `task_ids` (the tasks sent to the LLM), ids the model made up are dropped, so they
+    cannot overwrite or reassign another person's rows.
+    """
+    allowed = None if task_ids is None else {int(task_id) for task_id in task_ids}
+    by_id = {}
+    for task_id, scored in scored_tasks.items():
+        try:
+            task_id = int(task_id)
+        except (TypeError, ValueError):
+            continue
+        if allowed is None or task_id in allowed:
+            by_id[task_id] = scored  # "5" and 5 must not become two rows of one upsert
+    rows = [
+        {
+            "task_id": task_id,
+            "kr_code": kr_code,
+            "score": _score_value(scored),
+            "score_spread": _score_spread(scored),
+            "person": person,
+        } for task_id, scored in by_id.items()
     ]
-
-    # Bulk insert
-    session.bulk_save_objects(score_records)
+    if rows:
+        dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(taskscore).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["task_id", "kr_code"],
+            set_={"score": stmt.excluded.score, "score_spread": stmt.excluded.score_spread,
+                  "person": stmt.excluded.person},
+        )
+        session.execute(stmt)
     session.commit()
+
+
+def _score_value(scored):
+    return scored["score"] if isinstance(scored, dict) else scored
+
+
+def _score_spread(scored):
+    # Never NULL for new rows: a NULL spread marks legacy 0-400 scores (alembic b8e4d2a6c913)
+    spread = scored.get("spread") if isinstance(scored, dict) else None
+    return 0.0 if spread is None else spread
@@ -0,0 +1,129 @@
+# services/jobs.py
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from core.analyzer import OKRAnalyzer
+from models.ps_sql_schema import get_task_db
+from models.schemas import JobStatus
+from services.metrics import track_run
+
+JOB_WORKERS = int(os.getenv("OKR_JOB_WORKERS", "2"))  # analysis runs executed at the same time
+JOB_HISTORY = int(os.getenv("OKR_JOB_HISTORY", "100"))  # finished jobs kept for status queries
+
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+
+class Job:
+    """
+    One background run: its status record plus the cancel flag handed to the runner.
+    """
+
+    def __init__(self, kind: str, params: dict):
+        self.status = JobStatus(job_id=uuid.uuid4().hex, kind=kind, status="queued",
+                                params=params, created_at=time.time())
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def update_progress(self, done: int, total: int):
+        with self._lock:
+            status = self.status
+            status.pairs_done, status.pairs_total = done, total
+            status.pairs_remaining = max(total - done, 0)
+            elapsed = time.time() - (status.started_at or time.time())
+            status.eta_seconds = round(elapsed / done * status.pairs_remaining, 1) if done else None
+
+    def snapshot(self) -> JobStatus:
+        with self._lock:
+            return self.status.model_copy(deep=True)
+
+
+class JobManager:
+    """
+    Runs long analyses on a small worker pool so HTTP workers return immediately.
+    Jobs live in process memory; status is lost when the server restarts.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="okr-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, runner, **params) -> JobStatus:
+        """
+        Queue `runner(job, **params)`; its return value is stored as the job result.
+        """
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.status.job_id] = job
+            self._prune()
+        self._pool.submit(self._run, job, runner, params)
+        return job.snapshot()
+
+    def _run(self, job: Job, runner, params: dict):
+        with job._lock:
+            if job.cancel_event.is_set():
+                job.status.status, job.status.finished_at = "cancelled", time.time()
+                return
+            job.status.status, job.status.started_at = "running", time.time()
+        try:
+            result = runner(job, **params)
+            with job._lock:
+                job.status.result = result
+                job.status.status = "cancelled" if job.cancel_event.is_set() else "succeeded"
+        except Exception as e:
+            with job._lock:
+                job.status.status, job.status.error = "failed", str(e)
+        finally:
+            with job._lock:
+                job.status.finished_at = time.time()
+                job.status.eta_seconds = None
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.snapshot() if job else None
+
+    def list(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.snapshot() for job in jobs]
+
+    def cancel(self, job_id: str):
+        """
+        Ask a queued or running job to stop; a running scoring run drops its in-flight requests.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        with job._lock:
+            if job.status.status == "queued":
+                job.status.status, job.status.finished_at = "cancelled", time.time()
+        return job.snapshot()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status.status in FINISHED_STATES]
+        for job_id in finished[:max(len(finished) - JOB_HISTORY, 0)]:
+            del self._jobs[job_id]
+
+
+def run_scoring_job(job: Job, **params):
+    """
+    Job runner for the 3-step KR x person scoring run, with its own DB session.
+    """
+    db_dic = get_task_db()
+    try:
+        with track_run(f"jobs/{job.status.kind}"):
+            return asyncio.run(OKRAnalyzer.invoke_for_single_kr_with_description_for_split_tasks_3step_async(
+                db_dic, on_progress=job.update_progress, cancel_event=job.cancel_event, **params
+            ))
+    finally:
+        db_dic["session"].close()
+
+
+job_manager = JobManager()
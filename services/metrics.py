@@ -0,0 +1,224 @@
+# services/metrics.py
+"""
+In-process metrics: stage timers, LLM token/cost counters and per-run summaries.
+
+Counters and histograms are rendered in the Prometheus text format by GET /metrics.
+Labels come from the current context: `track_run(endpoint)` around an entry point and
+`metric_labels(kr_code=..., person=...)` around the work for one KR/person. Context variables
+follow asyncio tasks and asyncio.to_thread; wrap callables given to thread pools with
+`propagate` so their LLM calls keep the caller's labels.
+"""
+import collections
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from models.schemas import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K tokens, defaults are gpt-4o list prices
+OPENAI_PROMPT_COST_PER_1K = float(os.getenv("OPENAI_PROMPT_COST_PER_1K", "0.0025"))
+OPENAI_COMPLETION_COST_PER_1K = float(os.getenv("OPENAI_COMPLETION_COST_PER_1K", "0.01"))
+METRICS_RUN_HISTORY = int(os.getenv("OKR_METRICS_RUN_HISTORY", "50"))  # run summaries kept for /metrics/runs
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_labels = contextvars.ContextVar("metric_labels", default={"endpoint": "", "kr_code": "", "person": ""})
+_current_run = contextvars.ContextVar("current_run", default=None)
+_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name, self.documentation, self.labelnames = name, documentation, labelnames
+        self._values = collections.defaultdict(float)
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with _lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{{{_label_text(self.labelnames, key)}}} {value:g}" for key, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=STAGE_BUCKETS):
+        self.name, self.documentation, self.labelnames, self.buckets = name, documentation, labelnames, buckets
+        self._values = {}  # labels -> [bucket counts..., count, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in values:
+            labels = _label_text(self.labelnames, key)
+            for bound, count in zip(self.buckets, state):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {state[-2]}')
+            lines.append(f"{self.name}_count{{{labels}}} {state[-2]}")
+            lines.append(f"{self.name}_sum{{{labels}}} {state[-1]:g}")
+        return lines
+
+
+stage_seconds = Histogram("okr_stage_seconds", "Time spent per pipeline stage.", ("stage", "endpoint"))
+llm_requests = Counter("okr_llm_requests_total", "Chat completion requests by outcome (ok, error, cached).",
+                       ("endpoint", "outcome"))
+llm_tokens = Counter("okr_llm_tokens_total", "Prompt and completion tokens reported by the API.",
+                     ("endpoint", "kr_code", "person", "kind"))
+llm_cost = Counter("okr_llm_cost_usd_total", "Estimated LLM cost in USD.", ("endpoint", "kr_code", "person"))
+runs_total = Counter("okr_runs_total", "Finished runs per endpoint and status.", ("endpoint", "status"))
+result_cache_requests = Counter("okr_result_cache_requests_total", "Per-KR result cache lookups (hit, miss, refresh).",
+                                ("endpoint", "outcome"))
+REGISTRY = (stage_seconds, llm_requests, llm_tokens, llm_cost, runs_total, result_cache_requests)
+
+_recent_runs = collections.deque(maxlen=METRICS_RUN_HISTORY)
+
+
+@contextmanager
+def metric_labels(**labels):
+    """
+    Attribute LLM usage inside the block to the given kr_code / person / endpoint.
+    """
+    token = _labels.set({**_labels.get(), **{name: str(value) for name, value in labels.items()}})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+@contextmanager
+def track_run(endpoint):
+    """
+    Label everything inside the block with `endpoint` and collect a RunMetrics summary,
+    which is logged as one JSON line and kept for GET /metrics/runs when the block exits.
+    """
+    run = RunMetrics(run_id=uuid.uuid4().hex[:12], endpoint=endpoint, started_at=time.time())
+    labels_token = _labels.set({**_labels.get(), "endpoint": endpoint})
+    run_token = _current_run.set(run)
+    started = time.perf_counter()
+    status = "failed"
+    try:
+        yield run
+        status = "succeeded"
+    finally:
+        _current_run.reset(run_token)
+        _labels.reset(labels_token)
+        with _lock:
+            run.status = status
+            run.wall_seconds = round(time.perf_counter() - started, 3)
+            run.cost_usd = round(run.cost_usd, 6)
+            run.stage_seconds = {stage: round(seconds, 4) for stage, seconds in run.stage_seconds.items()}
+            _recent_runs.append(run)
+        runs_total.inc(endpoint=endpoint, status=status)
+        logger.info("run summary " + json.dumps(run.model_dump(), ensure_ascii=False))
+
+
+@contextmanager
+def timer(stage):
+    """
+    Time the block as pipeline `stage` (workbook_load, prompt_build, llm_call, json_parse, db_write).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def observe_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage, endpoint=_labels.get()["endpoint"])
+    run = _current_run.get()
+    if run is not None:
+        with _lock:
+            run.stage_seconds[stage] = run.stage_seconds.get(stage, 0.0) + seconds
+
+
+def timed(stage):
+    """
+    Decorator form of `timer` for plain functions.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(fn):
+    """
+    `fn` bound to the current metrics context, for callables run on thread pools.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def record_llm_call(usage=None, outcome="ok"):
+    """
+    Count one chat completion request and add its `response.usage` to the token and cost counters.
+    """
+    labels = _labels.get()
+    llm_requests.inc(endpoint=labels["endpoint"], outcome=outcome)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cost = (prompt_tokens * OPENAI_PROMPT_COST_PER_1K + completion_tokens * OPENAI_COMPLETION_COST_PER_1K) / 1000
+    if usage is not None:
+        llm_tokens.inc(prompt_tokens, kind="prompt", **labels)
+        llm_tokens.inc(completion_tokens, kind="completion", **labels)
+        llm_cost.inc(cost, **labels)
+    run = _current_run.get()
+    if run is None:
+        return
+    with _lock:
+        if outcome == "cached":
+            run.cached_calls += 1
+        elif outcome == "error":
+            run.failed_calls += 1
+        else:
+            run.llm_calls += 1
+            run.prompt_tokens += prompt_tokens
+            run.completion_tokens += completion_tokens
+            run.cost_usd += cost
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def recent_runs():
+    with _lock:
+        return [run.model_copy() for run in _recent_runs]
@@ -1,7 +1,15 @@
 # services/openai_client.py
+import functools
+import json
 import os
+import time
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI, NOT_GIVEN
+
+from services.llm_cache import llm_cache, make_cache_key, OPENAI_CACHE_BYPASS
+from services.metrics import observe_stage, record_llm_call, timer
+from services.rate_limit import rate_limiter
+from utils.tokens import count_messages_tokens
 
 # Load environment variables from .env
 load_dotenv()
@@ -18,9 +26,52 @@ client = AzureOpenAI(
     azure_endpoint=AZURE_OPENAI_ENDPOINT,
     api_key=AZURE_OPENAI_API_KEY,
     api_version=AZURE_OPENAI_API_VERSION,
+    max_retries=0,  # retries are handled by services.rate_limit
+)
+
+# Async client used by the concurrent scoring engine
+async_client = AsyncAzureOpenAI(
+    azure_endpoint=AZURE_OPENAI_ENDPOINT,
+    api_key=AZURE_OPENAI_API_KEY,
+    api_version=AZURE_OPENAI_API_VERSION,
+    max_retries=0,  # retries are handled by services.rate_limit
 )
 
 
+class TruncatedResponseError(RuntimeError):
+    """
+    The completion stopped at max_tokens (finish_reason == "length").
+    """
+
+
+def _cache_key(messages, deployment, temperature, max_tokens, top_p, seed, use_cache, n=1, response_format=None,
+               sample=0):
+    # None means the response cache is disabled or bypassed for this call
+    if llm_cache is None or not use_cache or OPENAI_CACHE_BYPASS:
+        return None
+    params = dict(temperature=temperature, max_tokens=max_tokens, top_p=top_p, seed=seed)
+    if n != 1:
+        params["n"] = n
+    if sample:
+        # Self-consistency samples of one prompt are cached separately, not replayed from sample 0
+        params["sample"] = sample
+    if response_format is not None:
+        params["response_format"] = response_format
+    return make_cache_key(deployment, messages, **params)
+
+
+def _estimated_tokens(messages, max_tokens, n=1):
+    # What the TPM quota is charged up front: prompt plus the completion limit of every choice
+    return count_messages_tokens(messages) + max_tokens * n
+
+
+def _stream_params(messages, deployment, temperature, max_tokens, top_p, seed, response_format):
+    params = dict(messages=messages, model=deployment, max_tokens=max_tokens, temperature=temperature,
+                  top_p=top_p, seed=seed, stream=True, stream_options={"include_usage": True})
+    if response_format is not None:
+        params["response_format"] = response_format
+    return params
+
 
 class OpenAIClient:
     @staticmethod
@@ -30,7 +81,11 @@ class OpenAIClient:
             temperature: float = 0.0,  # Deterministic mode
             max_tokens: int = 8196,
             top_p: float = 1.0,
-            seed: int = 42  # Fixed seed for reproducibility
+            seed: int = 42,  # Fixed seed for reproducibility
+            use_cache: bool = True,
+            raise_on_truncation: bool = False,
+            response_format: dict = None,
+            sample: int = 0
     ) -> str:
         """
         Send a chat completion request to Azure OpenAI with deterministic settings.
@@ -41,18 +96,278 @@ class OpenAIClient:
         :param max_tokens: Max response tokens
         :param top_p: Nucleus sampling parameter
         :param seed: Random seed for reproducibility
+        :param use_cache: Set to False to bypass the response cache for this call
+        :param raise_on_truncation: Raise TruncatedResponseError instead of returning a reply cut off at max_tokens
+        :param response_format: JSON mode ({"type": "json_object"}) or a strict {"type": "json_schema", ...}
+        :param sample: Index of a self-consistency sample; part of the cache key so samples are cached apart
         :return: The assistant's reply text
         """
+        cache_key = _cache_key(messages, deployment, temperature, max_tokens, top_p, seed, use_cache,
+                               response_format=response_format, sample=sample)
+        if cache_key is not None:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                record_llm_call(outcome="cached")
+                return cached
         try:
-            response = client.chat.completions.create(
-                messages=messages,
-                model=deployment,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                seed=seed  # Critical for reproducibility
-            )
+            with timer("llm_call"):
+                response = rate_limiter.call(
+                    functools.partial(
+                        client.chat.completions.create,
+                        messages=messages,
+                        model=deployment,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        seed=seed,  # Critical for reproducibility
+                        response_format=response_format or NOT_GIVEN
+                    ),
+                    _estimated_tokens(messages, max_tokens)
+                )
+
+            content = response.choices[0].message.content.strip()
+            finish_reason = response.choices[0].finish_reason
+        except Exception as e:
+            record_llm_call(outcome="error")
+            raise RuntimeError(f"Azure OpenAI Chat API call failed: {e}")
+        record_llm_call(response.usage)
+
+        if raise_on_truncation and finish_reason == "length":
+            raise TruncatedResponseError(f"Completion truncated at max_tokens={max_tokens}")
+
+        # A reply cut off at max_tokens is returned (it may still be repaired) but never cached
+        if cache_key is not None and finish_reason != "length":
+            llm_cache.set(cache_key, content)
+        return content
+
+    @staticmethod
+    def chat_n(
+            messages,
+            n: int,
+            deployment: str = AZURE_OPENAI_DEPLOYMENT,
+            temperature: float = 0.0,
+            max_tokens: int = 8196,
+            top_p: float = 1.0,
+            seed: int = 42,
+            use_cache: bool = True,
+            response_format: dict = None,
+            sample: int = 0
+    ) -> list:
+        """
+        Request `n` completions of the same prompt in a single API call.
+        `sample` is the index of the first of them among the self-consistency samples (cache key only).
+
+        :return: List with the text of every returned choice
+        """
+        cache_key = _cache_key(messages, deployment, temperature, max_tokens, top_p, seed, use_cache, n=n,
+                               response_format=response_format, sample=sample)
+        if cache_key is not None:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                record_llm_call(outcome="cached")
+                return json.loads(cached)
+        try:
+            with timer("llm_call"):
+                response = rate_limiter.call(
+                    functools.partial(
+                        client.chat.completions.create,
+                        messages=messages,
+                        model=deployment,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        seed=seed,
+                        n=n,
+                        response_format=response_format or NOT_GIVEN
+                    ),
+                    _estimated_tokens(messages, max_tokens, n)
+                )
+
+            contents = [choice.message.content.strip() for choice in response.choices]
+            truncated = any(choice.finish_reason == "length" for choice in response.choices)
+        except Exception as e:
+            record_llm_call(outcome="error")
+            raise RuntimeError(f"Azure OpenAI Chat API call failed: {e}")
+        record_llm_call(response.usage)
+
+        if cache_key is not None and not truncated:
+            llm_cache.set(cache_key, json.dumps(contents, ensure_ascii=False))
+        return contents
+
+
+
+class AsyncOpenAIClient:
+    @staticmethod
+    async def chat(
+            messages,
+            deployment: str = AZURE_OPENAI_DEPLOYMENT,
+            temperature: float = 0.0,  # Deterministic mode
+            max_tokens: int = 8196,
+            top_p: float = 1.0,
+            seed: int = 42,  # Fixed seed for reproducibility
+            use_cache: bool = True,
+            raise_on_truncation: bool = False,
+            response_format: dict = None,
+            sample: int = 0
+    ) -> str:
+        """
+        Async counterpart of OpenAIClient.chat, so many requests can be in flight at once.
+
+        :param messages: List of {"role": ..., "content": ...} dicts
+        :param deployment: Model deployment name
+        :param temperature: Sampling temperature (0 for deterministic)
+        :param max_tokens: Max response tokens
+        :param top_p: Nucleus sampling parameter
+        :param seed: Random seed for reproducibility
+        :param use_cache: Set to False to bypass the response cache for this call
+        :param raise_on_truncation: Raise TruncatedResponseError instead of returning a reply cut off at max_tokens
+        :param response_format: JSON mode ({"type": "json_object"}) or a strict {"type": "json_schema", ...}
+        :param sample: Index of a self-consistency sample; part of the cache key so samples are cached apart
+        :return: The assistant's reply text
+        """
+        cache_key = _cache_key(messages, deployment, temperature, max_tokens, top_p, seed, use_cache,
+                               response_format=response_format, sample=sample)
+        if cache_key is not None:
+            cached = await llm_cache.aget(cache_key)
+            if cached is not None:
+                record_llm_call(outcome="cached")
+                return cached
+        try:
+            with timer("llm_call"):
+                response = await rate_limiter.acall(
+                    functools.partial(
+                        async_client.chat.completions.create,
+                        messages=messages,
+                        model=deployment,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        seed=seed,  # Critical for reproducibility
+                        response_format=response_format or NOT_GIVEN
+                    ),
+                    _estimated_tokens(messages, max_tokens)
+                )
+
+            content = response.choices[0].message.content.strip()
+            finish_reason = response.choices[0].finish_reason
+        except Exception as e:
+            record_llm_call(outcome="error")
+            raise RuntimeError(f"Azure OpenAI Chat API call failed: {e}")
+        record_llm_call(response.usage)
+
+        if raise_on_truncation and finish_reason == "length":
+            raise TruncatedResponseError(f"Completion truncated at max_tokens={max_tokens}")
+
+        # A reply cut off at max_tokens is returned (it may still be repaired) but never cached
+        if cache_key is not None and finish_reason != "length":
+            await llm_cache.aset(cache_key, content)
+        return content
+
+    @staticmethod
+    async def chat_n(
+            messages,
+            n: int,
+            deployment: str = AZURE_OPENAI_DEPLOYMENT,
+            temperature: float = 0.0,
+            max_tokens: int = 8196,
+            top_p: float = 1.0,
+            seed: int = 42,
+            use_cache: bool = True,
+            response_format: dict = None,
+            sample: int = 0
+    ) -> list:
+        """
+        Request `n` completions of the same prompt in a single API call.
+        `sample` is the index of the first of them among the self-consistency samples (cache key only).
+
+        :return: List with the text of every returned choice
+        """
+        cache_key = _cache_key(messages, deployment, temperature, max_tokens, top_p, seed, use_cache, n=n,
+                               response_format=response_format, sample=sample)
+        if cache_key is not None:
+            cached = await llm_cache.aget(cache_key)
+            if cached is not None:
+                record_llm_call(outcome="cached")
+                return json.loads(cached)
+        try:
+            with timer("llm_call"):
+                response = await rate_limiter.acall(
+                    functools.partial(
+                        async_client.chat.completions.create,
+                        messages=messages,
+                        model=deployment,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        seed=seed,
+                        n=n,
+                        response_format=response_format or NOT_GIVEN
+                    ),
+                    _estimated_tokens(messages, max_tokens, n)
+                )
+
+            contents = [choice.message.content.strip() for choice in response.choices]
+            truncated = any(choice.finish_reason == "length" for choice in response.choices)
+        except Exception as e:
+            record_llm_call(outcome="error")
+            raise RuntimeError(f"Azure OpenAI Chat API call failed: {e}")
+        record_llm_call(response.usage)
+
+        if cache_key is not None and not truncated:
+            await llm_cache.aset(cache_key, json.dumps(contents, ensure_ascii=False))
+        return contents
+
+    @staticmethod
+    async def chat_stream(
+            messages,
+            deployment: str = AZURE_OPENAI_DEPLOYMENT,
+            temperature: float = 0.0,
+            max_tokens: int = 8196,
+            top_p: float = 1.0,
+            seed: int = 42,
+            use_cache: bool = True,
+            response_format: dict = None
+    ):
+        """
+        Stream a chat completion, yielding text deltas as they arrive (stream=True).
+        Feed them to utils.extract_json_prompt.StreamingJSONParser to act on partial output.
 
-            return response.choices[0].message.content.strip()
+        :param response_format: e.g. {"type": "json_object"} for JSON mode
+        :return: Async generator of reply text chunks; the full reply is cached once the stream ends
+        """
+        cache_key = _cache_key(messages, deployment, temperature, max_tokens, top_p, seed, use_cache,
+                               response_format=response_format)
+        if cache_key is not None:
+            cached = await llm_cache.aget(cache_key)
+            if cached is not None:
+                record_llm_call(outcome="cached")
+                yield cached
+                return
+        started = time.perf_counter()
+        try:
+            stream = await rate_limiter.acall(
+                functools.partial(
+                    async_client.chat.completions.create,
+                    **_stream_params(messages, deployment, temperature, max_tokens, top_p, seed, response_format)
+                ),
+                _estimated_tokens(messages, max_tokens)
+            )
+            parts, usage, finish_reason = [], None, None
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                # With include_usage the last chunk carries the usage and no choices
+                usage = getattr(chunk, "usage", None) or usage
         except Exception as e:
-            raise RuntimeError(f"Azure OpenAI Chat API call failed: {e}")
\ No newline at end of file
+            record_llm_call(outcome="error")
+            raise RuntimeError(f"Azure OpenAI Chat API call failed: {e}")
+        finally:
+            observe_stage("llm_call", time.perf_counter() - started)
+        record_llm_call(usage)
+
+        if cache_key is not None and finish_reason != "length":
+            await llm_cache.aset(cache_key, "".join(parts))
@@ -0,0 +1,214 @@
+# services/rate_limit.py
+"""
+Client-side throttling and retries for Azure OpenAI calls.
+
+- RPM / TPM token buckets shared by every thread and event loop of the process, so the
+  request rate stays under the deployment quota instead of running into 429s.
+- Retries of rate-limit, timeout, connection and 5xx errors with exponential backoff and
+  full jitter, never sooner than the server's Retry-After.
+- A circuit breaker that fails fast while the endpoint keeps failing, instead of letting every
+  queued request wait out its retries.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "0"))  # requests per minute, 0 = unlimited
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))  # tokens per minute, 0 = unlimited
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1"))  # seconds, doubled per attempt
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "60"))
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "120"))  # seconds per call
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))  # consecutive failures to open
+OPENAI_BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", "30"))  # seconds before a trial call
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                    openai.InternalServerError)
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    The endpoint failed repeatedly and calls are rejected until the cooldown ends.
+    """
+
+
+class TokenBucket:
+    """
+    Per-minute budget refilled continuously. `reserve` never blocks: it takes the amount
+    (the balance may go negative) and returns how long the caller must wait before sending,
+    so the same bucket serves threads (time.sleep) and coroutines (asyncio.sleep).
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self._available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        # A single request larger than the whole bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._available -= amount
+            return 0.0 if self._available >= 0 else -self._available / self.rate
+
+    def refund(self, amount: float):
+        # Return the unused part of an estimate once the real usage is known
+        with self._lock:
+            self._refill(time.monotonic())
+            self._available = min(self.capacity, self._available + amount)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures; after `cooldown` seconds one trial call is let
+    through, and its outcome closes the breaker or opens it again.
+    """
+
+    def __init__(self, threshold: int = OPENAI_BREAKER_THRESHOLD, cooldown: float = OPENAI_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpenError(f"Azure OpenAI circuit open after {self._failures} consecutive failures"
+                                       f"{f', retry in {remaining:.0f}s' if remaining > 0 else ''}")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures, self._opened_at, self._trial_running = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.threshold > 0 and self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Azure OpenAI circuit opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+
+class RateLimiter:
+    """
+    RPM/TPM buckets, retry policy and circuit breaker around one deployment's calls.
+    """
+
+    def __init__(self, rpm: int = OPENAI_RPM_LIMIT, tpm: int = OPENAI_TPM_LIMIT,
+                 max_retries: int = OPENAI_MAX_RETRIES, timeout: float = OPENAI_REQUEST_TIMEOUT):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        wait = self.requests.reserve(1) if self.requests else 0.0
+        if self.tokens:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        return wait
+
+    def _settle(self, response, estimated_tokens: int):
+        usage = getattr(response, "usage", None)
+        if self.tokens and usage is not None and usage.total_tokens < estimated_tokens:
+            self.tokens.refund(estimated_tokens - usage.total_tokens)
+
+    def _on_error(self, e: Exception, attempt: int):
+        """
+        Backoff delay before the next attempt, or re-raise when the error is final.
+        """
+        if not isinstance(e, RETRYABLE_ERRORS) or isinstance(e, openai.RateLimitError):
+            # The endpoint answered (a 4xx, or a 429 meaning "slow down"), so it is not down
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        if not isinstance(e, RETRYABLE_ERRORS):
+            raise e
+        if attempt >= self.max_retries:
+            raise e
+        delay = backoff_delay(attempt, retry_after(e))
+        logger.warning(f"Azure OpenAI call failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} "
+                       f"in {delay:.1f}s: {e}")
+        return delay
+
+    def call(self, create, estimated_tokens: int):
+        """
+        Run `create(timeout=...)` with throttling and retries; returns its response.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            wait = self._reserve(estimated_tokens)
+            if wait:
+                time.sleep(wait)
+            try:
+                response = create(timeout=self.timeout)
+            except Exception as e:
+                time.sleep(self._on_error(e, attempt))
+                continue
+            self.breaker.record_success()
+            self._settle(response, estimated_tokens)
+            return response
+
+    async def acall(self, create, estimated_tokens: int):
+        """
+        Async counterpart of `call` for coroutine factories such as AsyncAzureOpenAI methods.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            wait = self._reserve(estimated_tokens)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                response = await create(timeout=self.timeout)
+            except Exception as e:
+                await asyncio.sleep(self._on_error(e, attempt))
+                continue
+            self.breaker.record_success()
+            self._settle(response, estimated_tokens)
+            return response
+
+
+def retry_after(e: Exception) -> float:
+    """
+    Seconds the server asked us to wait (retry-after-ms / retry-after headers), or 0.
+    """
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 0.0
+
+
+def backoff_delay(attempt: int, server_delay: float = 0.0) -> float:
+    # Full jitter over an exponentially growing window, but never sooner than Retry-After
+    window = min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt)
+    return max(server_delay, random.uniform(0, window))
+
+
+rate_limiter = RateLimiter()
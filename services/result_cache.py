@@ -0,0 +1,121 @@
+# services/result_cache.py
+"""
+Cache of finished per-KR analysis results.
+
+Entries are keyed by (endpoint, kr_code, content fingerprints of the workbooks the result was
+built from, analysis settings), so editing a spreadsheet invalidates them without any explicit
+purge. Results live in an in-process LRU and, when OKR_RESULT_CACHE_DIR is set, also as JSON
+files that survive restarts and are shared between workers.
+"""
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from services.metrics import result_cache_requests
+from utils.workbook_cache import workbook_fingerprint
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_SIZE = int(os.getenv("OKR_RESULT_CACHE_SIZE", "256"))  # in-process entries, 0 = cache disabled
+RESULT_CACHE_DIR = os.getenv("OKR_RESULT_CACHE_DIR", "")  # on-disk copy, e.g. "assets/cache/results"
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, directory: str = RESULT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def key(self, endpoint: str, kr_code: str, workbooks, *settings) -> tuple:
+        """
+        (prefix, key): the prefix names the (endpoint, KR) slot, the key also covers the workbook
+        contents and the settings the result depends on.
+        """
+        prefix = _digest(endpoint, kr_code)
+        fingerprints = [workbook_fingerprint(path) for path in workbooks]
+        return prefix, f"{prefix}-{_digest(fingerprints, *settings)}"
+
+    def get_or_compute(self, endpoint: str, kr_code: str, workbooks, compute, settings=(), refresh=False) -> dict:
+        """
+        Cached JSON-able result of `compute()`. Concurrent requests for the same key wait for
+        the first one instead of starting their own LLM calls; failures are not cached.
+        """
+        if not self.max_entries:
+            return compute()
+        prefix, key = self.key(endpoint, kr_code, workbooks, *settings)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                value = None if refresh else self._get(key)
+                if value is not None:
+                    result_cache_requests.inc(endpoint=endpoint, outcome="hit")
+                    return value
+                result_cache_requests.inc(endpoint=endpoint, outcome="refresh" if refresh else "miss")
+                value = compute()
+                self._set(prefix, key, value)
+                return value
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+    def _get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        if not self.directory:
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{key}.json"), encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def _set(self, prefix, key, value):
+        self._remember(key, value)
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{key}.json")
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            # Results of older workbook versions for the same slot can never be hit again
+            for name in os.listdir(self.directory):
+                if name.startswith(f"{prefix}-") and name.endswith(".json") and name != f"{key}.json":
+                    os.remove(os.path.join(self.directory, name))
+        except OSError as e:
+            logger.warning(f"Result not written to {self.directory}: {e}")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.directory, name))
+
+
+result_cache = ResultCache()
@@ -0,0 +1,134 @@
+# services/score_queries.py
+"""
+Read-side queries over stored scores, for dashboards.
+
+Per-KR and per-person numbers come from the materialized views kr_person_scores and
+kr_person_day_scores (alembic revision e5b8d1c3f7a2), which are refreshed after every scoring
+run, so these endpoints never call the LLM and don't aggregate task_scores on each request.
+Top-N task lists read task_scores directly through its (kr_code, person) index.
+"""
+import logging
+import os
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as ScoreJSONResponse
+except ImportError:  # standard json encoder
+    ScoreJSONResponse = JSONResponse
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_REFRESH = os.getenv("OKR_ROLLUP_REFRESH", "1") == "1"  # refresh the views after scoring runs
+ROLLUP_VIEWS = ("kr_person_scores", "kr_person_day_scores")
+MAX_PAGE_SIZE = 1000
+
+
+def refresh_score_rollups(session):
+    """
+    Refresh the rollup views without blocking readers. A database without the views
+    (migration not applied) only logs a warning, the scores themselves are already saved.
+    """
+    if not ROLLUP_REFRESH:
+        return
+    try:
+        for view in ROLLUP_VIEWS:
+            session.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+        session.commit()
+    except SQLAlchemyError as e:
+        session.rollback()
+        logger.warning(f"Score rollups not refreshed (run `alembic upgrade head`?): {e}")
+
+
+def _page(session, select_sql, count_sql, params, limit, offset):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    rows = session.execute(text(f"{select_sql} LIMIT :limit OFFSET :offset"),
+                           {**params, "limit": limit, "offset": offset}).mappings()
+    total = session.execute(text(count_sql), params).scalar()
+    return {"items": [dict(row) for row in rows], "total": total, "limit": limit, "offset": offset}
+
+
+def _day_filter(day_from, day_to, column="day"):
+    # Days are stored as fixed-width strings (e.g. "14040206"), so they compare in date order
+    clauses, params = [], {}
+    if day_from is not None:
+        clauses.append(f"{column} >= :day_from")
+        params["day_from"] = str(day_from)
+    if day_to is not None:
+        clauses.append(f"{column} <= :day_to")
+        params["day_to"] = str(day_to)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def kr_summaries(session, limit=100, offset=0):
+    """
+    One row per KR: people and tasks scored, relevant tasks and the average score.
+    """
+    select_sql = (
+        "SELECT kr_code, count(*) AS persons, sum(tasks_scored) AS tasks_scored, "
+        "sum(relevant_tasks) AS relevant_tasks, "
+        "round((sum(avg_score * tasks_scored) / sum(tasks_scored))::numeric, 1)::float AS avg_score, "
+        "max(max_score) AS max_score "
+        "FROM kr_person_scores GROUP BY kr_code ORDER BY kr_code"
+    )
+    count_sql = "SELECT count(DISTINCT kr_code) FROM kr_person_scores"
+    return _page(session, select_sql, count_sql, {}, limit, offset)
+
+
+def kr_scores(session, kr_code, day_from=None, day_to=None, limit=100, offset=0):
+    """
+    Per-person scores of one KR, over all days or the given day range.
+    """
+    return _grouped_scores(session, "kr_code", kr_code, "person", day_from, day_to, limit, offset)
+
+
+def person_scores(session, person, day_from=None, day_to=None, limit=100, offset=0):
+    """
+    Per-KR scores of one person, over all days or the given day range.
+    """
+    return _grouped_scores(session, "person", person, "kr_code", day_from, day_to, limit, offset)
+
+
+def _grouped_scores(session, key_column, key, group_column, day_from, day_to, limit, offset):
+    params = {"key": key}
+    if day_from is None and day_to is None:
+        select_sql = (
+            f"SELECT {group_column}, tasks_scored, relevant_tasks, avg_score, max_score "
+            f"FROM kr_person_scores WHERE {key_column} = :key "
+            f"ORDER BY avg_score DESC, {group_column}"
+        )
+        count_sql = f"SELECT count(*) FROM kr_person_scores WHERE {key_column} = :key"
+        return _page(session, select_sql, count_sql, params, limit, offset)
+
+    days_sql, day_params = _day_filter(day_from, day_to)
+    params.update(day_params)
+    select_sql = (
+        f"SELECT {group_column}, sum(tasks_scored) AS tasks_scored, sum(relevant_tasks) AS relevant_tasks, "
+        "round((sum(score_sum)::numeric / sum(tasks_scored)), 1)::float AS avg_score, "
+        "max(max_score) AS max_score "
+        f"FROM kr_person_day_scores WHERE {key_column} = :key{days_sql} "
+        f"GROUP BY {group_column} ORDER BY avg_score DESC, {group_column}"
+    )
+    count_sql = (f"SELECT count(DISTINCT {group_column}) FROM kr_person_day_scores "
+                 f"WHERE {key_column} = :key{days_sql}")
+    return _page(session, select_sql, count_sql, params, limit, offset)
+
+
+def top_tasks(session, kr_code, person=None, day_from=None, day_to=None, min_score=0, limit=20, offset=0):
+    """
+    Highest-scoring tasks of a KR with their text, person and day.
+    """
+    filters, params = " AND ts.score >= :min_score", {"kr_code": kr_code, "min_score": min_score}
+    if person is not None:
+        filters += " AND ts.person = :person"
+        params["person"] = person
+    days_sql, day_params = _day_filter(day_from, day_to, "t.day")
+    params.update(day_params)
+    from_sql = f"FROM task_scores ts JOIN tasks t ON t.id = ts.task_id WHERE ts.kr_code = :kr_code{filters}{days_sql}"
+    select_sql = (f"SELECT ts.task_id, ts.person, t.day, ts.score, ts.score_spread, t.task {from_sql} "
+                  "ORDER BY ts.score DESC, ts.task_id")
+    return _page(session, select_sql, f"SELECT count(*) {from_sql}", params, limit, offset)
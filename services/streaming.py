@@ -0,0 +1,42 @@
+# services/streaming.py
+import json
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def format_event(data: dict, fmt: str, event: str = "result") -> str:
+    """
+    One streamed record: a JSON line for NDJSON, or an `event:`/`data:` block for Server-Sent Events.
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+def stream_events(events, fmt: str, summary=None) -> StreamingResponse:
+    """
+    Wrap an async iterator of dicts into a streaming response.
+    A final "done" record (with `summary()` when given) marks the end of the stream.
+    """
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown stream format '{fmt}' (use 'ndjson' or 'sse')")
+
+    async def body():
+        try:
+            async for data in events:
+                yield format_event(data, fmt)
+        except Exception as e:
+            yield format_event({"error": getattr(e, "detail", None) or str(e)}, fmt, event="error")
+            return
+        yield format_event({"done": True, **(summary() if summary else {})}, fmt, event="done")
+
+    # X-Accel-Buffering stops nginx-style proxies from holding back the chunks
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[fmt],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
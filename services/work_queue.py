@@ -0,0 +1,293 @@
+# services/work_queue.py
+"""
+Postgres-backed queue of scoring work items (table scoring_work_items).
+
+A run is planned once into one row per (KR group, person), which doubles as the run's ledger:
+each row records whether its pairs are pending, running, done or failed, with the attempts made
+and the last error, so an interrupted run can be resumed without redoing finished items.
+Any number of worker processes (worker.py) and the in-process /analyze_v2 engines claim rows
+with SELECT ... FOR UPDATE SKIP LOCKED, so no two workers get the same item. A claimed item
+is leased: its worker extends the lease with heartbeats, and an item whose worker died becomes
+claimable again once the lease expires. Failures are retried with a growing delay until
+OKR_QUEUE_MAX_ATTEMPTS, then the item is marked failed.
+Times are naive UTC from the workers' clocks, which the lease length comfortably covers.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.ps_sql_schema import ScoringWorkItem, SessionLocal, Tasks
+from models.schemas import OKR, QueueRunStatus
+
+QUEUE_LEASE_SECONDS = int(os.getenv("OKR_QUEUE_LEASE_SECONDS", "300"))  # claim lifetime without a heartbeat
+QUEUE_HEARTBEAT_SECONDS = int(os.getenv("OKR_QUEUE_HEARTBEAT_SECONDS", "60"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("OKR_QUEUE_MAX_ATTEMPTS", "3"))
+QUEUE_RETRY_DELAY = int(os.getenv("OKR_QUEUE_RETRY_DELAY", "60"))  # seconds, multiplied by the attempt number
+QUEUE_POLL_SECONDS = float(os.getenv("OKR_QUEUE_POLL_SECONDS", "5"))  # wait when no item is due yet
+
+logger = logging.getLogger(__name__)
+
+
+class ClaimedItem(NamedTuple):
+    id: int
+    run_id: str
+    person: str
+    okrs: List[OKR]
+    task_text: str
+    task_ids: List[int]
+    attempts: int
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def new_worker_id() -> str:
+    # Lease owner name: host, process and a per-claimer suffix
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _kr_codes_hash(kr_codes) -> str:
+    # Same digest as Postgres md5(kr_codes), which backfills rows queued before the column existed
+    return hashlib.md5(kr_codes.encode("utf-8")).hexdigest()
+
+
+def add_work_items(session, run_id, work_items) -> int:
+    """
+    Insert the (okr_group, person, task_text, task_ids) items of a run; items already queued for
+    the run are left as they are, so planning the same run again is harmless.
+    """
+    now = _utcnow()
+    rows = []
+    for okr_group, person, task_text, task_ids in work_items:
+        kr_codes = ",".join(okr.id for okr in okr_group)
+        rows.append({
+            "run_id": run_id,
+            "kr_codes": kr_codes,
+            "kr_codes_hash": _kr_codes_hash(kr_codes),
+            "person": person,
+            "okrs": json.dumps([okr.model_dump() for okr in okr_group], ensure_ascii=False),
+            "task_text": task_text,
+            "task_ids": json.dumps(task_ids),
+            "status": "pending",
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now,
+            "updated_at": now,
+        })
+    if rows:
+        dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(ScoringWorkItem).values(rows)
+        session.execute(stmt.on_conflict_do_nothing(index_elements=["run_id", "kr_codes_hash", "person"]))
+    session.commit()
+    return len(rows)
+
+
+def claim_work_item(session, worker_id, run_id=None, lease_seconds=None, max_attempts=None):
+    """
+    Lease the next due item to `worker_id`: a pending item whose retry delay has passed, or a
+    running item whose lease expired. Returns a ClaimedItem, or None when nothing is due.
+    """
+    lease_seconds = lease_seconds or QUEUE_LEASE_SECONDS
+    max_attempts = max_attempts or QUEUE_MAX_ATTEMPTS
+    now = _utcnow()
+    expire_abandoned(session, now, max_attempts)
+
+    query = (
+        select(ScoringWorkItem)
+        .where(or_(
+            and_(ScoringWorkItem.status == "pending", ScoringWorkItem.available_at <= now),
+            and_(ScoringWorkItem.status == "running", ScoringWorkItem.lease_expires_at < now,
+                 ScoringWorkItem.attempts < max_attempts),
+        ))
+        .order_by(ScoringWorkItem.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if run_id is not None:
+        query = query.where(ScoringWorkItem.run_id == run_id)
+    item = session.execute(query).scalars().first()
+    if item is None:
+        session.commit()
+        return None
+    item.status = "running"
+    item.attempts += 1
+    item.lease_owner = worker_id
+    item.lease_expires_at = now + datetime.timedelta(seconds=lease_seconds)
+    item.updated_at = now
+    if item.task_ids is not None:
+        task_ids = json.loads(item.task_ids)
+    else:
+        # Queued before task_ids was stored: any task of the item's person
+        task_ids = list(session.execute(select(Tasks.id).where(Tasks.person == item.person)).scalars())
+    claimed = ClaimedItem(id=item.id, run_id=item.run_id, person=item.person,
+                          okrs=[OKR(**okr) for okr in json.loads(item.okrs)],
+                          task_text=item.task_text, task_ids=task_ids, attempts=item.attempts)
+    session.commit()
+    return claimed
+
+
+def expire_abandoned(session, now=None, max_attempts=None):
+    # Running items whose lease ran out on their last allowed attempt are not retried again
+    now = now or _utcnow()
+    session.execute(
+        update(ScoringWorkItem)
+        .where(ScoringWorkItem.status == "running", ScoringWorkItem.lease_expires_at < now,
+               ScoringWorkItem.attempts >= (max_attempts or QUEUE_MAX_ATTEMPTS))
+        .values(status="failed", last_error="lease expired", lease_owner=None, updated_at=now)
+    )
+
+
+def heartbeat(session, item_id, worker_id, lease_seconds=None) -> bool:
+    """
+    Extend the lease of an item; False when the worker no longer holds it.
+    """
+    now = _utcnow()
+    result = session.execute(
+        update(ScoringWorkItem)
+        .where(ScoringWorkItem.id == item_id, ScoringWorkItem.lease_owner == worker_id,
+               ScoringWorkItem.status == "running")
+        .values(lease_expires_at=now + datetime.timedelta(seconds=lease_seconds or QUEUE_LEASE_SECONDS),
+                updated_at=now)
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def complete_work_item(session, item_id, worker_id):
+    # Scores are upserted, so an item finished by a worker that lost its lease is still consistent
+    session.execute(
+        update(ScoringWorkItem)
+        .where(ScoringWorkItem.id == item_id, ScoringWorkItem.lease_owner == worker_id)
+        .values(status="done", last_error=None, lease_owner=None, lease_expires_at=None, updated_at=_utcnow())
+    )
+    session.commit()
+
+
+def fail_work_item(session, item_id, worker_id, error, max_attempts=None, retry_delay=None):
+    """
+    Record a failed attempt: the item is queued again after a delay, or marked failed once
+    it has used all its attempts. Returns the new status (None when the lease was lost).
+    """
+    max_attempts = max_attempts or QUEUE_MAX_ATTEMPTS
+    retry_delay = QUEUE_RETRY_DELAY if retry_delay is None else retry_delay
+    item = session.get(ScoringWorkItem, item_id)
+    if item is None or item.lease_owner != worker_id:
+        session.commit()
+        return None
+    now = _utcnow()
+    item.last_error = str(error)[:2000]
+    item.lease_owner, item.lease_expires_at, item.updated_at = None, None, now
+    if item.attempts >= max_attempts:
+        item.status = "failed"
+    else:
+        item.status = "pending"
+        item.available_at = now + datetime.timedelta(seconds=retry_delay * item.attempts)
+    session.commit()
+    return item.status
+
+
+def release_work_item(session, item_id, worker_id):
+    # Hand an unfinished item back (run cancelled or stopped), without counting the attempt
+    session.execute(
+        update(ScoringWorkItem)
+        .where(ScoringWorkItem.id == item_id, ScoringWorkItem.lease_owner == worker_id,
+               ScoringWorkItem.status == "running")
+        .values(status="pending", attempts=ScoringWorkItem.attempts - 1, lease_owner=None,
+                lease_expires_at=None, available_at=_utcnow(), updated_at=_utcnow())
+    )
+    session.commit()
+
+
+class LeaseHeartbeat:
+    """
+    Keeps the lease of one claimed item alive from a background thread, on its own session.
+    """
+
+    def __init__(self, item_id, worker_id, interval=None):
+        self.item_id, self.worker_id = item_id, worker_id
+        self.interval = interval or QUEUE_HEARTBEAT_SECONDS
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        session = SessionLocal()
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if not heartbeat(session, self.item_id, self.worker_id):
+                        logger.warning(f"lease on item {self.item_id} lost; its result will still be saved")
+                        return
+                except Exception as e:
+                    session.rollback()
+                    logger.warning(f"heartbeat for item {self.item_id} failed: {e}")
+        finally:
+            session.close()
+
+
+def run_status(session, run_id) -> QueueRunStatus:
+    """
+    Item counts per state of a run, with the error of every failed item.
+    """
+    counts = dict(session.execute(
+        select(ScoringWorkItem.status, func.count())
+        .where(ScoringWorkItem.run_id == run_id)
+        .group_by(ScoringWorkItem.status)
+    ).all())
+    failures = session.execute(
+        select(ScoringWorkItem.kr_codes, ScoringWorkItem.person, ScoringWorkItem.attempts,
+               ScoringWorkItem.last_error)
+        .where(ScoringWorkItem.run_id == run_id, ScoringWorkItem.status == "failed")
+        .order_by(ScoringWorkItem.id)
+    ).mappings().all()
+    return QueueRunStatus(run_id=run_id, total=sum(counts.values()), failures=[dict(row) for row in failures],
+                          **counts)
+
+
+def is_run_finished(session, run_id) -> bool:
+    status = run_status(session, run_id)
+    return status.pending == 0 and status.running == 0
+
+
+def retry_failed_items(session, run_id) -> int:
+    """
+    Queue the failed items of a run again with a fresh set of attempts.
+    """
+    now = _utcnow()
+    result = session.execute(
+        update(ScoringWorkItem)
+        .where(ScoringWorkItem.run_id == run_id, ScoringWorkItem.status == "failed")
+        .values(status="pending", attempts=0, available_at=now, updated_at=now)
+    )
+    session.commit()
+    return result.rowcount
+
+
+def run_pair_counts(session, run_id) -> dict:
+    """
+    (KR, person) pairs of a run per item state; batched items hold several pairs.
+    """
+    counts = {}
+    rows = session.execute(
+        select(ScoringWorkItem.kr_codes, ScoringWorkItem.status).where(ScoringWorkItem.run_id == run_id)
+    ).all()
+    for kr_codes, status in rows:
+        counts[status] = counts.get(status, 0) + len(kr_codes.split(","))
+    return counts
@@ -1,136 +1,119 @@
+import logging
 import pandas as pd
 from typing import List
 from models.schemas import TaskRow, OKR, InputPayload, InputPayload_with_description
+from services.metrics import timed
+from utils.workbook_cache import read_excel_cached
+from utils.kr_index import get_kr_index
 
+logger = logging.getLogger(__name__)
 
-def run_analysis_cli(task_xlsx="assets/excel/team tasks spreadsheet.xlsx", okr_xlsx="assets/excel/okr.xlsx"):
+TASK_XLSX = "assets/excel/team tasks spreadsheet.xlsx"
+OKR_XLSX = "assets/excel/okr.xlsx"
+SPM_OKR_XLSX = "assets/excel/SPM BI OKR 1404.xlsx"
+
+
+def run_analysis_cli(task_xlsx=TASK_XLSX, okr_xlsx=OKR_XLSX):
     # load from Excel
     task_rows = load_task_table(task_xlsx)
     okr_list = load_okrs(okr_xlsx)
-    print("files loaded")
-    print(task_rows)
-    print(okr_list)
-    payload = InputPayload(task_table=task_rows, okrs=okr_list)
-    print("payload returned")
-    return payload
+    logger.info(f"loaded {len(task_rows)} task rows and {len(okr_list)} OKRs")
+    return InputPayload(task_table=task_rows, okrs=okr_list)
 
 
-def run_analysis_cli_with_description(kr_code="", task_xlsx="assets/excel/team tasks spreadsheet.xlsx",
-                                      okr_xlsx="assets/excel/SPM BI OKR 1404.xlsx"):
+def run_analysis_cli_with_description(kr_code="", task_xlsx=TASK_XLSX, okr_xlsx=SPM_OKR_XLSX):
     # load from Excel
     task_rows = load_task_table(task_xlsx)
     okr_list, okr_text = load_okrs_with_objective(okr_xlsx, kr_code)
-
-    print("files loaded")
-    print(task_rows)
-    print(okr_list)
-    payload = InputPayload_with_description(task_table=task_rows, okrs=okr_list, okrs_text=okr_text)
-    print("payload returned")
-    return payload
+    logger.info(f"loaded {len(task_rows)} task rows and {len(okr_list)} OKRs")
+    return InputPayload_with_description(task_table=task_rows, okrs=okr_list, okrs_text=okr_text)
 
 
 # utils/excel_reader.py
 
 
+@timed("workbook_load")
 def load_task_table(path: str) -> List[TaskRow]:
     """
     Reads an Excel file where each row is one work‐day and columns are:
       date, day, <person1>, <person2>, ...
     Returns a list of TaskRow, each with .tasks mapping person->task_str.
     """
-    df = pd.read_excel(path, engine="openpyxl")
+    df = read_excel_cached(path)
+    return [TaskRow(tasks=tasks) for tasks in task_table_dicts(df)]
+
+
+def task_table_dicts(df) -> List[dict]:
+    """
+    One {person: task_str} dict per spreadsheet row, built from a long person-day-task frame
+    instead of visiting every cell with iterrows.
+    """
     # assume first two cols are metadata
     task_cols = [c for c in df.columns if c not in ("date", "day")]
-    rows: List[TaskRow] = []
-    for _, r in df.iterrows():
-        tasks = {}
-        for col in task_cols:
-            val = r[col]
-            if pd.notna(val):
-                # preserve multiline strings
-                tasks[col] = str(val).strip()
-        rows.append(TaskRow(tasks=tasks))
+    long = (
+        df[task_cols]
+        .reset_index(drop=True)
+        .rename_axis("row")
+        .reset_index()
+        .melt(id_vars="row", var_name="person", value_name="task")
+        .dropna(subset=["task"])
+        .sort_values("row", kind="stable")  # keep column order inside each row
+    )
+    # preserve multiline strings
+    long["task"] = long["task"].astype(str).str.strip()
+
+    rows = [{} for _ in range(len(df))]
+    for row, person, task in zip(long["row"], long["person"], long["task"]):
+        rows[row][person] = task
     return rows
 
 
-def load_daily_task_table(df, day) -> str:
+def index_daily_task_table(df) -> dict:
     """
-    Reads an Excel file where each row is one work‐day and columns are:
-      date, day, <person1>, <person2>, ...
-    Returns a list of TaskRow, each with .tasks mapping person->task_str.
+    Day-indexed lookup {date: rendered rows} for load_daily_task_table,
+    built with one groupby pass instead of a full scan per day.
     """
-    pd.set_option("display.max_colwidth", None)  # Remove column width limit
-    pd.set_option("display.width", None)  # Auto-detect terminal width
+    with pd.option_context("display.max_colwidth", None, "display.width", None):
+        return {
+            day: str([df.loc[i] for i in positions])
+            for day, positions in df.groupby("date", sort=False).groups.items()
+        }
 
-    # Convert a specific row to string (e.g., row index 0)
-    tasks_row = [c for ind, c in df.iterrows() if c["date"] == day]
-    # assume first two cols are metadata
 
-    return str(tasks_row)
+def load_daily_task_table(df, day, index=None) -> str:
+    """
+    Renders the spreadsheet row(s) of one day as text for the task-splitting prompt.
+    Pass the result of index_daily_task_table(df) as `index` when rendering many days.
+    """
+    if index is not None:
+        return index.get(day, "[]")
+    with pd.option_context("display.max_colwidth", None, "display.width", None):
+        return str([df.loc[i] for i in df.index[df["date"] == day]])
 
 
+@timed("workbook_load")
 def load_okrs(path: str) -> List[OKR]:
     """
     Reads an Excel file where the first column holds each Key Result.
     Auto‐assigns IDs KR1, KR2, … in order of appearance.
     """
-    df = pd.read_excel(path, engine="openpyxl")
+    return okrs_from_frame(read_excel_cached(path))
 
-    # Handle missing values
-    df["Key Results"] = df["Key Results"].fillna("")
 
-    # Vectorized operation (faster than iterrows)
-    okrs = [
-        OKR(id=str(row["KR_code"]).strip(), description=str(row["Key Results"]).strip())
-        for _, row in df.iterrows()
-    ]
-    return okrs
+def okrs_from_frame(df) -> List[OKR]:
+    # KR_code / Key Results columns to OKRs; a missing description becomes ""
+    ids = df["KR_code"].astype(str).str.strip()
+    descriptions = df["Key Results"].fillna("").astype(str).str.strip()
+    return [OKR(id=okr_id, description=description) for okr_id, description in zip(ids, descriptions)]
 
 
+@timed("workbook_load")
 def load_okrs_with_objective(path: str, okr_code: str):
     """
-    Reads an Excel file where the first column holds each Key Result.
-    Auto‐assigns IDs KR1, KR2, … in order of appearance.
+    Reads the SPM BI OKR workbook and returns (okrs, okr_text), where okr_text is the
+    Objective -> GM KR -> BI KR context of `okr_code` ("" when no code is given).
+    Backed by the cached KR context index, so repeated calls don't re-read the workbook.
     """
-    import pandas as pd
-    # 1. Read & filter
-    df = pd.read_excel(
-        path,
-        sheet_name='SPMBI OKR 1404Q1-python'
-    )
-    filtered_df = df[df['SPM BI Key Results (نتایج کلیدی)'].notna() & df['SPM BI Key Results (نتایج کلیدی)'].astype(
-        str).str.strip().ne('')]
-    if not okr_code == "":
-        filtered = filtered_df[filtered_df['SPMBIKR-CODE'] == okr_code]
-        print(f"filtered {okr_code}:", )
-        flag_description = True  # toggle whether to include the description field
-        # 2. Build the text
-        lines = []
-        for obj, obj_df in filtered.groupby('Objective (هدف)'):
-            kr_lines = []
-            for gm_kr, kr_df in obj_df.groupby('SPM Key Results (نتایج کلیدی)'):
-                # collect all the BI‐level KRs under this GM KR
-                items = []
-                for _, row in kr_df.iterrows():
-                    bi_kr = row['SPM BI Key Results (نتایج کلیدی)']
-                    if flag_description:
-                        desc = row['Descriptin (توضیحات)']
-                        items.append(f"**KR: {bi_kr}, KR_Description: {desc}**")
-                    else:
-                        items.append(f"**KR: {bi_kr}**")
-                kr_list = ", ".join(items)
-                kr_lines.append(f"###for GM KR *{gm_kr}* we have these team KRs:[{kr_list}]###")
-            # join all the GM KR blocks under this Objective
-            joined_kr_blocks = " ".join(kr_lines)
-            lines.append(f"for GM Objective *{obj}* we have these GM KRs:[{joined_kr_blocks}]")
-        # 3. Final output
-        okr_text = "\n\n".join(lines)
-        print(okr_text)
-    else:
-        okr_text = ""
-
-    okrs = [
-        OKR(id=str(row["SPMBIKR-CODE"]).strip(), description=str(row["SPM BI Key Results (نتایج کلیدی)"]).strip())
-        for _, row in filtered_df.iterrows()
-    ]
-    return okrs, okr_text
+    index = get_kr_index(path)
+    okr_text = index.context_text(okr_code) if okr_code != "" else ""
+    return list(index.okrs), okr_text
@@ -1,37 +1,179 @@
 import json
 import re
 
+from services.metrics import timed
 
-def extract_json_from_response(response_text: str) -> dict:
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+@timed("json_parse")
+def extract_json_from_response(response_text: str, repair: bool = False) -> dict:
     """
     Extracts the JSON block from LLM response text (with ```json ... ```).
     Cleans and loads it into a Python dictionary.
+    Plain JSON replies (JSON mode / structured outputs) are accepted as-is.
+    With `repair`, a reply cut off mid-JSON is closed after its last complete value.
     """
     # Use regex to find the first ```json ... ``` block
     match = re.search(r"```json(.*?)```", response_text, re.DOTALL)
-    if not match:
+    if match:
+        # Extract inside the code block
+        json_text = match.group(1).strip()
+    else:
         start_index = response_text.find('{')
         end_index = response_text.rfind('}')
-
-        # Check if both indices are valid
-        if start_index != -1 and end_index != -1 and start_index < end_index:
+        if start_index == -1:
+            raise ValueError("No JSON object found in response")
+        if repair:
+            # A truncated reply may have no closing brace (or an unclosed ```json fence)
+            json_text = response_text[start_index:]
+        elif start_index < end_index:
             # Extract the substring between the first '{' and the last '}'
-            json_str = response_text[start_index:end_index + 1].strip()
-            # print("Extracted JSON String:", json_str)
-            try:
-                data = json.loads(json_str)
-                return data
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Failed to decode JSON: {e}")
+            json_text = response_text[start_index:end_index + 1].strip()
         else:
-            print("No valid JSON found between the first '{' and the last '}'")
-
-    # Extract inside the code block
-    json_text = match.group(1).strip()
+            raise ValueError("No valid JSON found between the first '{' and the last '}'")
 
     # Load as dict
     try:
-        data = json.loads(json_text)
-        return data
+        return json.loads(json_text)
+    except json.JSONDecodeError as e:
+        if not repair:
+            raise ValueError(f"Failed to decode JSON: {e}")
+    try:
+        return json.loads(repair_json(json_text))
     except json.JSONDecodeError as e:
-        raise ValueError(f"Failed to decode JSON: {e}")
+        raise ValueError(f"Failed to decode JSON after repairing the truncated tail: {e}")
+
+
+def repair_json(text: str) -> str:
+    """
+    Close a truncated JSON document: everything after the last complete value
+    (an unfinished string, key or entry) is dropped and the open brackets are closed.
+    """
+    start = min([i for i in (text.find("{"), text.find("[")) if i != -1], default=-1)
+    if start == -1:
+        return text
+    stack, in_string, escape = [], False, False
+    cut, cut_stack = start, []
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            cut, cut_stack = i + 1, list(stack)
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            cut, cut_stack = i + 1, list(stack)
+            if not stack:
+                return text[:i + 1]
+        elif char == ",":
+            # The value before a comma is complete
+            cut, cut_stack = i, list(stack)
+    return text[:cut] + "".join(_CLOSERS[bracket] for bracket in reversed(cut_stack))
+
+
+class StreamingJSONParser:
+    """
+    Incremental parser for streamed completions.
+
+    Feed it text chunks as they arrive; it returns every array element that has been fully
+    received, as (array_key, item), for arrays stored under `items_key` (e.g. "all_task_scores")
+    or directly inside the object under `items_key` (e.g. the per-KR lists of "kr_scores").
+    Text before the first '{' (prose, a ```json fence) and after the document is ignored.
+    """
+
+    def __init__(self, items_key: str = "all_task_scores"):
+        self.items_key = items_key
+        self.buffer = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        # One frame per open container: [bracket, key, current member key, collecting, item start]
+        self._stack = []
+
+    def feed(self, chunk: str) -> list:
+        self.buffer += chunk
+        items = []
+        text = self.buffer
+        while self._pos < len(text) and not self._done:
+            i, char = self._pos, text[self._pos]
+            self._pos += 1
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._open(char, None)
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+                continue
+            frame = self._stack[-1]
+            if frame[3] and frame[4] is None and not char.isspace() and char not in ",]":
+                frame[4] = i  # first character of the next array element
+            if char == '"':
+                self._in_string, self._string_start = True, i
+            elif char == ":" and frame[0] == "{":
+                frame[2] = json.loads(self._last_string)
+            elif char in "{[":
+                self._open(char, frame[2] if frame[0] == "{" else None)
+            elif char in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    self._done = True
+                    break
+                parent = self._stack[-1]
+                if parent[3] and parent[4] is not None:
+                    items += self._emit(parent, text, i + 1)
+            elif char == "," and frame[3] and frame[4] is not None:
+                items += self._emit(frame, text, i)
+            if char == "]" and frame[3] and frame[4] is not None:
+                # scalar element closed by the end of its array
+                items += self._emit(frame, text, i)
+        return items
+
+    def _open(self, bracket, key):
+        parent = self._stack[-1] if self._stack else None
+        in_items_object = parent is not None and parent[0] == "{" and parent[1] == self.items_key
+        collecting = bracket == "[" and (key == self.items_key or in_items_object)
+        self._stack.append([bracket, key, None, collecting, None])
+
+    def _emit(self, frame, text, end):
+        raw = text[frame[4]:end].strip()
+        frame[4] = None
+        if not raw:
+            return []
+        try:
+            return [(frame[1], json.loads(raw))]
+        except json.JSONDecodeError:
+            # an element we cannot parse is skipped
+            return []
+
+    @property
+    def complete(self) -> bool:
+        return self._done
+
+    def finish(self) -> dict:
+        """
+        The whole document once the stream has ended, repairing a truncated tail.
+        """
+        return extract_json_from_response(self.buffer, repair=True)
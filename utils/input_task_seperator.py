@@ -1,17 +1,30 @@
-import pandas as pd
+"""
+Ingest the team task spreadsheet into the tasks table.
+
+Each day row is split into individual Persian task sentences by the LLM and bulk inserted.
+Days that are already in the database are skipped (one query up front), the per-day LLM
+calls run concurrently on a bounded thread pool, and a failed day is reported without
+aborting the rest of the run.
+
+Usage:
+    python -m utils.input_task_seperator --xlsx "assets/excel/team tasks spreadsheet.xlsx" --workers 8
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from models.ps_sql_schema import get_task_db
-from services.db_tasks import is_day_in_db
+from services.db_tasks import get_existing_days, bulk_insert_tasks
+from services.metrics import propagate, timed, timer, track_run
 from services.openai_client import OpenAIClient
-from utils.excel_reader import load_daily_task_table
+from utils.excel_reader import index_daily_task_table
 from utils.extract_json_prompt import extract_json_from_response
+from utils.workbook_cache import read_excel_cached
+
+INGEST_WORKERS = int(os.getenv("OKR_INGEST_WORKERS", "8"))
 
-session, Tasks, _ = get_task_db()  # Convert to Gregorian date
-df = pd.read_excel("../assets/excel/team tasks spreadsheet.xlsx", engine="openpyxl")
-for day in df["date"].unique():
-    day_str = str(int(day))
-    day_tasks = load_daily_task_table(df, day)
-    prompt_sys = """Your task is to process the table data below and generate a **JSON** output listing **daily tasks for each person**. Follow these rules strictly:  
+PROMPT_SYS = """Your task is to process the table data below and generate a **JSON** output listing **daily tasks for each person**. Follow these rules strictly:  
    
    1. **Input Data**:  
       - The data spans multiple days (rows). Each row includes tasks for individuals like **Rezazadeh**, **Mamdoohi**, **Farmani**, etc.  
@@ -66,39 +79,95 @@ for day in df["date"].unique():
    - **Technical Terms**: Retain terms like `API`, `GitHub`, `OKR`, or translate them only if a standard Persian equivalent exists (e.g., `داده‌های Roaming` → `داده‌های رومینگ`).  
    - **Consistency**: Use consistent Persian terminology across all tasks.   """
 
-    prompt = prompt = [
-        {"role": "system", "content": (prompt_sys
-                                       )},
+
+@timed("prompt_build")
+def build_day_prompt(day_tasks):
+    return [
+        {"role": "system", "content": PROMPT_SYS},
         {"role": "user", "content": (
             "5. Input Data:\n"
             f"{day_tasks}"
         )}
     ]
-    if is_day_in_db(session, Tasks, day_str):
-        print(f"Day {day_str} already exists in database. Skipping...")
-        session.close()
-        continue
+
+
+def extract_day_tasks(day_tasks) -> dict:
+    """
+    Ask the LLM to split one day's row into {person: [task, ...]}.
+    """
+    content = OpenAIClient.chat(
+        build_day_prompt(day_tasks),
+        temperature=0,  # Deterministic output
+        seed=42  # Reproducibility
+    )
+    return extract_json_from_response(content)
+
+
+def ingest(task_xlsx, workers=INGEST_WORKERS):
+    """
+    Run the ingest and return {day_str: "inserted N tasks" | "skipped" | "failed: ..."}.
+    """
+    with track_run("ingest"):
+        return _ingest(task_xlsx, workers)
+
+
+def _ingest(task_xlsx, workers):
+    db_dic = get_task_db()
+    session, Tasks = db_dic["session"], db_dic["Tasks"]
+    with timer("workbook_load"):
+        df = read_excel_cached(task_xlsx)
+
+    existing_days = get_existing_days(session, Tasks)
+    daily_tasks = index_daily_task_table(df)
+    report = {}
+    pending = {}
+    for day in df["date"].dropna().unique():
+        day_str = str(int(day))
+        if day_str in existing_days:
+            report[day_str] = "skipped"
+            continue
+        pending[day_str] = daily_tasks[day]
+    print(f"{len(report)} days already in database, {len(pending)} days to ingest with {workers} workers")
+
+    started = time.perf_counter()
     try:
-        content = OpenAIClient.chat(
-            prompt,
-            temperature=0,  # Deterministic output
-            seed=42  # Reproducibility
-        )
-
-        # Extract JSON from response using triple backticks
-        data = extract_json_from_response(content)
-        print(data)
-
-        for person, tasks in data.items():
-            for task in tasks:
-                new_task = Tasks(
-                    day=str(day),
-                    person=person,
-                    task=task
-                )
-                session.add(new_task)
-
-        session.commit()
-        print(f"Tasks of {day} inserted successfully!")
-    except BaseException as e:
-        print(e)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(propagate(extract_day_tasks), day_tasks): day_str for day_str, day_tasks in pending.items()}
+            # LLM calls run in the pool; DB writes stay on this thread with its single session
+            for future in as_completed(futures):
+                day_str = futures[future]
+                try:
+                    data = future.result()
+                    rows = [
+                        {"day": day_str, "person": person, "task": task}
+                        for person, tasks in data.items()
+                        for task in tasks
+                    ]
+                    bulk_insert_tasks(session, Tasks, rows)
+                    report[day_str] = f"inserted {len(rows)} tasks"
+                except Exception as e:
+                    session.rollback()
+                    report[day_str] = f"failed: {e}"
+                print(f"Day {day_str}: {report[day_str]}")
+    finally:
+        session.close()
+
+    failed = [day_str for day_str, status in report.items() if status.startswith("failed")]
+    print(f"Ingest finished in {time.perf_counter() - started:.1f}s: "
+          f"{len(pending) - len(failed)} days inserted, {len(failed)} failed, "
+          f"{len(report) - len(pending)} skipped")
+    if failed:
+        print("Failed days: " + ", ".join(sorted(failed)))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest the team task spreadsheet into the tasks table.")
+    parser.add_argument("--xlsx", default="assets/excel/team tasks spreadsheet.xlsx")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = parser.parse_args()
+    ingest(args.xlsx, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# utils/kr_index.py
+import threading
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from models.schemas import OKR, KRContext
+from utils.workbook_cache import read_excel_cached, workbook_version
+
+OKR_SHEET = 'SPMBI OKR 1404Q1-python'
+CODE_COL = 'SPMBIKR-CODE'
+OBJECTIVE_COL = 'Objective (هدف)'
+GM_KR_COL = 'SPM Key Results (نتایج کلیدی)'
+BI_KR_COL = 'SPM BI Key Results (نتایج کلیدی)'
+DESCRIPTION_COL = 'Descriptin (توضیحات)'
+
+
+def _text(value) -> Optional[str]:
+    return None if pd.isna(value) else str(value)
+
+
+def render_kr_context(rows, flag_description=True) -> str:
+    """
+    Objective -> GM KR -> BI KR text for a set of workbook rows, in the format the
+    analysis prompts expect. Rows are (objective, gm_kr, bi_kr, description) tuples;
+    rows without an objective or GM KR are left out, as pandas groupby would.
+    """
+    grouped = {}
+    for objective, gm_kr, bi_kr, desc in rows:
+        if pd.isna(objective) or pd.isna(gm_kr):
+            continue
+        grouped.setdefault(objective, {}).setdefault(gm_kr, []).append((bi_kr, desc))
+
+    lines = []
+    for objective in sorted(grouped):
+        kr_lines = []
+        for gm_kr in sorted(grouped[objective]):
+            # collect all the BI‐level KRs under this GM KR
+            if flag_description:
+                items = [f"**KR: {bi_kr}, KR_Description: {desc}**" for bi_kr, desc in grouped[objective][gm_kr]]
+            else:
+                items = [f"**KR: {bi_kr}**" for bi_kr, _ in grouped[objective][gm_kr]]
+            kr_list = ", ".join(items)
+            kr_lines.append(f"###for GM KR *{gm_kr}* we have these team KRs:[{kr_list}]###")
+        # join all the GM KR blocks under this Objective
+        joined_kr_blocks = " ".join(kr_lines)
+        lines.append(f"for GM Objective *{objective}* we have these GM KRs:[{joined_kr_blocks}]")
+    return "\n\n".join(lines)
+
+
+class KRContextIndex:
+    """
+    Every BI KR of the OKR workbook with its hierarchy and rendered prompt context,
+    built in one pass over the sheet.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        bi_kr = df[BI_KR_COL]
+        filtered = df[bi_kr.notna() & bi_kr.astype(str).str.strip().ne('')]
+
+        self.okrs: List[OKR] = []
+        self._rows: Dict[str, list] = {}
+        self._children: Dict[tuple, List[str]] = {}
+        columns = [filtered[col] for col in (CODE_COL, OBJECTIVE_COL, GM_KR_COL, BI_KR_COL, DESCRIPTION_COL)]
+        for code, objective, gm_kr, bi_kr, desc in zip(*columns):
+            okr_id = str(code).strip()
+            self.okrs.append(OKR(id=okr_id, description=str(bi_kr).strip()))
+            self._rows.setdefault(okr_id, []).append((objective, gm_kr, bi_kr, desc))
+            children = self._children.setdefault((_text(objective), _text(gm_kr)), [])
+            if okr_id not in children:
+                children.append(okr_id)
+
+        self._contexts: Dict[str, KRContext] = {}
+        for okr_id, rows in self._rows.items():
+            objective, gm_kr, bi_kr, desc = rows[0]
+            self._contexts[okr_id] = KRContext(
+                code=okr_id,
+                objective=_text(objective),
+                gm_kr=_text(gm_kr),
+                description=str(bi_kr).strip(),
+                kr_description=_text(desc),
+                context_text=render_kr_context(rows),
+            )
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._contexts
+
+    def get(self, code: str) -> Optional[KRContext]:
+        return self._contexts.get(code)
+
+    def context_text(self, code: str) -> str:
+        context = self._contexts.get(code)
+        return context.context_text if context else ""
+
+    def parent(self, code: str):
+        """
+        (objective, GM KR) the BI KR belongs to, or None for an unknown code.
+        """
+        context = self._contexts.get(code)
+        return (context.objective, context.gm_kr) if context else None
+
+    def children(self, objective: Optional[str], gm_kr: Optional[str]) -> List[str]:
+        return list(self._children.get((objective, gm_kr), []))
+
+    def siblings(self, code: str) -> List[str]:
+        # Other BI KRs under the same GM KR
+        parent = self.parent(code)
+        if parent is None:
+            return []
+        return [okr_id for okr_id in self._children.get(parent, []) if okr_id != code]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_kr_index(path: str, sheet_name: str = OKR_SHEET) -> KRContextIndex:
+    """
+    KR context index of a workbook, rebuilt only when the file's mtime or size changes.
+    """
+    version = workbook_version(path)
+    key = (version[0], sheet_name)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    index = KRContextIndex(read_excel_cached(path, sheet_name=sheet_name))
+    with _indexes_lock:
+        _indexes[key] = (version, index)
+    return index
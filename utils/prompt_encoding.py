@@ -0,0 +1,73 @@
+# utils/prompt_encoding.py
+"""
+Compact renderings of task tables, task lists and KRs for LLM prompts.
+
+The verbose formats (indented JSON, `## task_id=..., task=... ##` markers) spend most of their
+tokens on whitespace, repeated person names and markup. The encoders here render the same data
+columnar and without indentation. `PromptCodec` replaces identifiers with short aliases; it is
+only used by benchmarks/prompt_encoding.py to measure that saving. Prompts sent to the model keep
+the real task ids and KR codes, so replies are used as they come.
+"""
+import json
+import re
+
+_WHITESPACE = re.compile(r"\s*\n\s*")
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _one_line(text: str) -> str:
+    # Line-oriented formats keep one record per line
+    return _WHITESPACE.sub(" / ", str(text).strip())
+
+
+class PromptCodec:
+    """
+    Short aliases for the identifiers of one prompt: tasks become 1, 2, ..., people P1, P2, ...
+    and KRs K1, K2, ....
+    """
+
+    PREFIXES = {"person": "P", "kr": "K"}
+
+    def __init__(self):
+        self._aliases = {kind: {} for kind in ("task", *self.PREFIXES)}
+
+    def alias(self, kind: str, value):
+        aliases = self._aliases[kind]
+        if value not in aliases:
+            number = len(aliases) + 1
+            short = number if kind == "task" else f"{self.PREFIXES[kind]}{number}"
+            aliases[value] = short
+        return aliases[value]
+
+
+def encode_task_table(task_table, codec: PromptCodec = None) -> str:
+    """
+    Columnar task table: each person is named once in "people" and every day is a row of
+    tasks in that column order, null where the person has no task.
+    """
+    rows = [getattr(row, "tasks", row) for row in task_table]
+    people = list(dict.fromkeys(person for tasks in rows for person in tasks))
+    header = [codec.alias("person", person) for person in people] if codec else people
+    return _dumps({"people": header, "days": [[tasks.get(person) for person in people] for tasks in rows]})
+
+
+def encode_person_tasks(tasks_for_person, person: str, codec: PromptCodec = None) -> str:
+    """
+    One `id|task` line per task, under a single header naming the person.
+    """
+    lines = [f"tasks of *{person}* (id|task):"]
+    for task in tasks_for_person:
+        task_id = codec.alias("task", task.id) if codec else task.id
+        lines.append(f"{task_id}|{_one_line(task.task)}")
+    return "\n".join(lines)
+
+
+def encode_okrs(okrs, codec: PromptCodec = None) -> str:
+    """
+    One `id|description` line per KR.
+    """
+    return "\n".join(f"{codec.alias('kr', okr.id) if codec else okr.id}|{_one_line(okr.description)}"
+                     for okr in okrs)
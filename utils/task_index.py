@@ -0,0 +1,205 @@
+# utils/task_index.py
+import logging
+import os
+import re
+import threading
+import zipfile
+import zlib
+
+import numpy as np
+
+TASK_INDEX_PATH = os.getenv("OKR_TASK_INDEX_PATH", "assets/cache/task_index.npz")
+
+logger = logging.getLogger(__name__)
+
+# Persian/Arabic variants folded to one form before feature extraction
+_CHAR_MAP = str.maketrans({
+    "\u064A": "\u06CC", "\u0649": "\u06CC",  # Arabic yeh / alef maksura -> Persian yeh
+    "\u0643": "\u06A9",  # Arabic kaf -> Persian keheh
+    "\u0629": "\u0647", "\u06C0": "\u0647",  # teh marbuta / heh with yeh -> heh
+    "\u0623": "\u0627", "\u0625": "\u0627", "\u0622": "\u0627",  # hamza/madda forms -> alef
+    "\u200C": " ", "\u200F": " ",  # zero-width non-joiner, RTL mark
+    "\u0640": "",  # tatweel
+    **{chr(0x06F0 + d): str(d) for d in range(10)},  # Persian digits
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # Arabic-Indic digits
+})
+_DIACRITICS = re.compile("[\u064B-\u065F\u0670]")
+_WORD = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    text = _DIACRITICS.sub("", str(text).translate(_CHAR_MAP))
+    return text.lower()
+
+
+def extract_features(text: str, ngram_range=(3, 5)):
+    """
+    Word tokens plus character n-grams inside each word (with boundary markers),
+    so Persian inflections and mixed Persian/English technical terms still overlap.
+    """
+    features = []
+    for word in _WORD.findall(normalize_text(text)):
+        features.append("w:" + word)
+        padded = f"<{word}>"
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            features.extend("c:" + padded[i:i + n] for i in range(len(padded) - n + 1))
+    return features
+
+
+class TaskIndex:
+    """
+    Hashed TF-IDF index over task texts, kept entirely in numpy arrays.
+
+    Features are hashed into a fixed space, so new tasks are appended without
+    refitting a vocabulary; IDF weights are recomputed from document frequencies
+    at query time.
+    """
+
+    def __init__(self, n_features: int = 2 ** 20, ngram_range=(3, 5)):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.task_ids = np.zeros(0, dtype=np.int64)
+        self.persons = np.zeros(0, dtype=object)
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        # Sparse term-frequency matrix stored as coordinate arrays (doc row, feature, log tf)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.cols = np.zeros(0, dtype=np.int64)
+        self.tf = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.task_ids)
+
+    @property
+    def max_task_id(self) -> int:
+        return int(self.task_ids.max()) if len(self.task_ids) else 0
+
+    def _hash(self, features):
+        return np.array([zlib.crc32(f.encode("utf-8")) % self.n_features for f in features], dtype=np.int64)
+
+    def _vectorize(self, text):
+        hashed = self._hash(extract_features(text, self.ngram_range))
+        cols, counts = np.unique(hashed, return_counts=True)
+        return cols, (1.0 + np.log(counts)).astype(np.float32)
+
+    def add(self, task_ids, texts, persons):
+        """
+        Append tasks to the index; ids that are already indexed are skipped.
+        """
+        known = set(self.task_ids.tolist())
+        rows, cols, tfs, new_ids, new_persons = [], [], [], [], []
+        row = len(self.task_ids)
+        for task_id, text, person in zip(task_ids, texts, persons):
+            if task_id in known:
+                continue
+            known.add(task_id)
+            doc_cols, doc_tf = self._vectorize(text)
+            rows.append(np.full(len(doc_cols), row, dtype=np.int64))
+            cols.append(doc_cols)
+            tfs.append(doc_tf)
+            new_ids.append(task_id)
+            new_persons.append(person)
+            row += 1
+        if not new_ids:
+            return 0
+        new_cols = np.concatenate(cols)
+        np.add.at(self.doc_freq, new_cols, 1)
+        self.rows = np.concatenate([self.rows] + rows)
+        self.cols = np.concatenate([self.cols, new_cols])
+        self.tf = np.concatenate([self.tf] + tfs)
+        self.task_ids = np.concatenate([self.task_ids, np.array(new_ids, dtype=np.int64)])
+        self.persons = np.concatenate([self.persons, np.array(new_persons, dtype=object)])
+        return len(new_ids)
+
+    def search(self, query: str, top_n: int = 50, person=None, task_ids=None):
+        """
+        Return [(task_id, cosine similarity)] for the best matching tasks, best first.
+        `person` and `task_ids` restrict which tasks compete for the top_n places.
+        """
+        n_docs = len(self.task_ids)
+        if not n_docs:
+            return []
+        idf = (np.log((1 + n_docs) / (1 + self.doc_freq)) + 1.0).astype(np.float32)
+        weights = self.tf * idf[self.cols]
+        norms = np.sqrt(np.bincount(self.rows, weights=weights ** 2, minlength=n_docs))
+
+        q_cols, q_tf = self._vectorize(query)
+        q_dense = np.zeros(self.n_features, dtype=np.float32)
+        q_dense[q_cols] = q_tf * idf[q_cols]
+        q_norm = np.linalg.norm(q_dense[q_cols])
+        if not q_norm:
+            return []
+        scores = np.bincount(self.rows, weights=weights * q_dense[self.cols], minlength=n_docs)
+        scores = scores / (np.maximum(norms, 1e-9) * q_norm)
+
+        mask = np.ones(n_docs, dtype=bool)
+        if person is not None:
+            mask &= self.persons == person
+        if task_ids is not None:
+            mask &= np.isin(self.task_ids, np.fromiter(task_ids, dtype=np.int64))
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        top_n = min(top_n, len(candidates))
+        best = candidates[np.argpartition(-scores[candidates], top_n - 1)[:top_n]]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(self.task_ids[i]), float(scores[i])) for i in best]
+
+    def shortlist(self, query: str, top_n: int = 50, person=None, task_ids=None):
+        # Candidate task ids only, for filtering what is sent to the LLM
+        return [task_id for task_id, _ in self.search(query, top_n, person, task_ids)]
+
+    def sync_from_db(self, session, Tasks):
+        """
+        Incrementally index tasks stored after the last indexed task id.
+        """
+        new_tasks = session.query(Tasks).filter(Tasks.id > self.max_task_id).order_by(Tasks.id).all()
+        return self.add([t.id for t in new_tasks], [t.task for t in new_tasks], [t.person for t in new_tasks])
+
+    def save(self, path: str = TASK_INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Several processes/threads may sync the index at once: write a private file, then swap it in
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    n_features=self.n_features, ngram_range=np.array(self.ngram_range),
+                    task_ids=self.task_ids, persons=self.persons.astype(str), doc_freq=self.doc_freq,
+                    rows=self.rows, cols=self.cols, tf=self.tf,
+                )
+            os.replace(tmp_path, path)
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    @classmethod
+    def load(cls, path: str = TASK_INDEX_PATH):
+        with np.load(path) as data:
+            index = cls(int(data["n_features"]), tuple(int(n) for n in data["ngram_range"]))
+            index.task_ids = data["task_ids"]
+            index.persons = data["persons"].astype(object)
+            index.doc_freq = data["doc_freq"]
+            index.rows, index.cols, index.tf = data["rows"], data["cols"], data["tf"]
+        return index
+
+
+def load_task_index(session, Tasks, path: str = TASK_INDEX_PATH) -> TaskIndex:
+    """
+    Load the persisted index (or start a new one), add any new tasks and save it back.
+    An unreadable index file is rebuilt from the database.
+    """
+    index = None
+    if os.path.exists(path):
+        try:
+            index = TaskIndex.load(path)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile, zlib.error) as e:
+            logger.warning(f"Rebuilding unreadable task index {path}: {e}")
+    if index is None:
+        index = TaskIndex()
+    if index.sync_from_db(session, Tasks):
+        index.save(path)
+    return index
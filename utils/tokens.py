@@ -0,0 +1,42 @@
+# utils/tokens.py
+import functools
+
+try:
+    import tiktoken
+except ImportError:  # fall back to the character-based estimate
+    tiktoken = None
+
+TOKENIZER_ENCODING = "o200k_base"  # GPT-4o family
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:  # encoding files not available offline
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for prompt budgeting.
+    Persian text averages close to 3 characters per token on the GPT-4o tokenizer.
+    """
+    return len(text) // 3 + 1
+
+
+def count_tokens(text: str) -> int:
+    """
+    Exact token count with the local tiktoken tokenizer, or estimate_tokens when it is unavailable.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_messages_tokens(messages) -> int:
+    # ~4 tokens of per-message overhead on top of the content
+    return sum(count_tokens(message["content"]) + 4 for message in messages)
@@ -0,0 +1,132 @@
+# utils/workbook_cache.py
+import glob
+import hashlib
+import logging
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # sidecars are skipped, workbooks are still memoised in-process
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+WORKBOOK_CACHE_DIR = os.getenv("OKR_WORKBOOK_CACHE_DIR", "assets/cache/workbooks")
+
+_memo = {}
+_fingerprints = {}  # absolute path -> (version, sha256)
+_memo_lock = threading.Lock()
+
+
+def workbook_version(path: str) -> tuple:
+    """
+    (absolute path, mtime, size) of a workbook; any edit to the file changes it.
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def workbook_fingerprint(path: str) -> str:
+    """
+    sha256 of the workbook's bytes. Hashed again only when its mtime or size changes,
+    so a re-saved but identical file keeps its fingerprint.
+    """
+    version = workbook_version(path)
+    with _memo_lock:
+        cached = _fingerprints.get(version[0])
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    fingerprint = digest.hexdigest()
+    with _memo_lock:
+        _fingerprints[version[0]] = (version, fingerprint)
+    return fingerprint
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _sidecar_path(version: tuple, sheet_name) -> str:
+    # <path+sheet>-<mtime+size>.arrow, so older versions of the same sheet can be found and removed
+    prefix = _digest(version[0], sheet_name)
+    return os.path.join(WORKBOOK_CACHE_DIR, f"{prefix}-{_digest(*version[1:])}.arrow")
+
+
+def _read_sidecar(path: str) -> pd.DataFrame:
+    # Memory-mapped Arrow IPC file; numeric columns are converted without copying
+    with pa.memory_map(path, "r") as source:
+        table = pa_ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+
+def _write_sidecar(path: str, df: pd.DataFrame):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Per-thread temp file: concurrent cold reads of the same sheet must not write into one file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa_ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    finally:
+        _remove_quietly(tmp_path)
+    prefix = os.path.basename(path).split("-")[0]
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f"{prefix}-*.arrow")):
+        if stale != path:
+            os.remove(stale)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def read_excel_cached(path: str, sheet_name=0) -> pd.DataFrame:
+    """
+    pd.read_excel with a columnar sidecar cache.
+
+    The first read of a sheet parses the .xlsx with openpyxl and stores an Arrow file keyed by
+    path + mtime + size; later reads memory-map that file instead. Results are also memoised
+    in-process. Callers get their own shallow copy, so adding or replacing columns is safe.
+    """
+    version = workbook_version(path)
+    memo_key = (version, sheet_name)
+    with _memo_lock:
+        df = _memo.get(memo_key)
+    if df is not None:
+        return df.copy(deep=False)
+
+    sidecar = _sidecar_path(version, sheet_name) if pa is not None else None
+    if sidecar and os.path.exists(sidecar):
+        try:
+            df = _read_sidecar(sidecar)
+        except (pa.ArrowException, OSError) as e:
+            # Truncated or corrupt sidecar: drop it and parse the workbook again
+            logger.warning(f"Discarding unreadable workbook sidecar {sidecar}: {e}")
+            _remove_quietly(sidecar)
+    if df is None:
+        df = pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl")
+        if sidecar:
+            try:
+                _write_sidecar(sidecar, df)
+            except (pa.ArrowException, OSError, TypeError, ValueError) as e:
+                # e.g. mixed-type columns Arrow cannot represent; keep the parsed frame
+                logger.warning(f"Skipping workbook sidecar for {path} [{sheet_name}]: {e}")
+
+    with _memo_lock:
+        # Drop memoised frames of older versions of the same sheet
+        for key in [key for key in _memo if key[0][0] == version[0] and key[1] == sheet_name]:
+            del _memo[key]
+        _memo[memo_key] = df
+    return df.copy(deep=False)
@@ -0,0 +1,129 @@
+"""
+Scoring worker: claims (KR, person) work items from the scoring_work_items queue, scores them
+and saves the scores with save_scores_in_db. Start as many as the Azure quota allows, on one
+or more machines sharing the database; each item is processed by exactly one worker at a time.
+
+Queue a run with POST /queue/analyze_v2 (or --enqueue), then:
+    python worker.py --threads 4
+    python worker.py --run-id 3f9c2a1b7d4e --exit-when-idle
+"""
+import argparse
+import logging
+import os
+import signal
+import threading
+
+from core.analyzer import enqueue_scoring_run, score_work_item, _kr_label
+from models.ps_sql_schema import get_task_db
+from services.db_tasks import save_scores_in_db
+from services.metrics import metric_labels
+from services.score_queries import refresh_score_rollups
+from services.work_queue import (claim_work_item, complete_work_item, fail_work_item, is_run_finished, new_worker_id,
+                                 LeaseHeartbeat, QUEUE_POLL_SECONDS)
+
+WORKER_THREADS = int(os.getenv("OKR_WORKER_THREADS", "2"))  # items processed at the same time per process
+
+logger = logging.getLogger("worker")
+
+
+def process_item(db_dic, item):
+    """
+    Score one claimed item and save its scores.
+    """
+    with metric_labels(endpoint="worker", kr_code=_kr_label(item.okrs), person=item.person):
+        scored_by_kr = score_work_item(item.okrs, item.task_text)
+    for kr_code, scored_tasks in scored_by_kr.items():
+        save_scores_in_db(scored_tasks, db_dic["session"], db_dic["TaskScore"], kr_code, item.person,
+                          item.task_ids)
+
+
+def work_once(db_dic, worker_id, stop_event, run_id=None, exit_when_idle=False):
+    """
+    Claim and process one item, or wait a poll interval when none is due.
+    Returns False when the worker should exit (idle with `exit_when_idle`).
+    """
+    session = db_dic["session"]
+    item = claim_work_item(session, worker_id, run_id)
+    if item is None:
+        if exit_when_idle and (run_id is None or is_run_finished(session, run_id)):
+            return False
+        stop_event.wait(QUEUE_POLL_SECONDS)
+        return True
+    codes = ",".join(okr.id for okr in item.okrs)
+    logger.info(f"{worker_id}: item {item.id} ({codes}, {item.person}), attempt {item.attempts}")
+    try:
+        with LeaseHeartbeat(item.id, worker_id):
+            process_item(db_dic, item)
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"{worker_id}: item {item.id} failed: {getattr(e, 'detail', None) or e}")
+        fail_work_item(session, item.id, worker_id, getattr(e, "detail", None) or e)
+        return True
+    complete_work_item(session, item.id, worker_id)
+    if is_run_finished(session, item.run_id):
+        logger.info(f"run {item.run_id} finished")
+        refresh_score_rollups(session)
+    return True
+
+
+def work(worker_id, stop_event, run_id=None, exit_when_idle=False):
+    """
+    Claim and process items until `stop_event` is set (or, with `exit_when_idle`, nothing is left).
+    """
+    db_dic = get_task_db()
+    session = db_dic["session"]
+    try:
+        while not stop_event.is_set():
+            try:
+                if not work_once(db_dic, worker_id, stop_event, run_id, exit_when_idle):
+                    return
+            except Exception:
+                # Connection resets, serialization failures, ...: keep the thread alive and retry
+                session.rollback()
+                logger.exception(f"{worker_id}: queue access failed, retrying in {QUEUE_POLL_SECONDS}s")
+                stop_event.wait(QUEUE_POLL_SECONDS)
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued scoring work items.")
+    parser.add_argument("--run-id", default=None, help="only process this run (default: any queued run)")
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS)
+    parser.add_argument("--exit-when-idle", action="store_true", help="stop once the run has no items left")
+    parser.add_argument("--enqueue", action="store_true", help="plan a new run into the queue first")
+    parser.add_argument("--batch-krs", action="store_true", help="with --enqueue: batch KRs per request")
+    parser.add_argument("--incremental", action="store_true", help="with --enqueue: only unscored tasks")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("OKR_LOG_LEVEL", "INFO"),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    run_id = args.run_id
+    if args.enqueue:
+        db_dic = get_task_db()
+        try:
+            run_id, items = enqueue_scoring_run(db_dic, run_id, batch_krs=args.batch_krs,
+                                                incremental=args.incremental)
+        finally:
+            db_dic["session"].close()
+        logger.info(f"run {run_id}: {items} items queued")
+
+    stop_event = threading.Event()
+    # Finish the items in hand on Ctrl-C / SIGTERM; their leases would otherwise have to expire
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop_event.set())
+
+    threads = [
+        threading.Thread(target=work, args=(new_worker_id(), stop_event, run_id, args.exit_when_idle))
+        for _ in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1)  # wake up for signals
+
+
+if __name__ == "__main__":
+    main()